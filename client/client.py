@@ -1,11 +1,19 @@
 import urequests as requests
+import json
 from server.models import StoryBeat
 from client.wifi_client import WifiClient
 from server.stats import Statistics
 
+# Buffered statistics are sent together once this many have been collected
+STATS_BATCH_SIZE = 10
+# Statistics kept for a later attempt when sending fails
+STATS_BUFFER_MAX = 50
+
 class Client:
     def __init__(self, base_url: str):
         self.base_url = base_url
+        self.session_id = None
+        self._stats_buffer = []
 
     def get_new_story(self) -> StoryBeat:
         """Get a new story from the API"""
@@ -13,6 +21,7 @@ class Client:
             response = requests.get(f"{self.base_url}/new")
             #response.raise_for_status()
             data = response.json()
+            self.session_id = data.get('session_id')
             beat = StoryBeat.from_dict(data['story_beat'])
             return beat
         except Exception as e:
@@ -23,7 +32,7 @@ class Client:
     def update_story(self, choice_id: int, success_result: str) -> StoryBeat:
         """Update the story with a choice and result"""
         try:
-            response = requests.post(f"{self.base_url}/update", json={"choice_id": choice_id, "success_result": success_result})
+            response = requests.post(f"{self.base_url}/update", json={"session_id": self.session_id, "choice_id": choice_id, "success_result": success_result})
             #response.raise_for_status()
             data = response.json()
             beat = StoryBeat.from_dict(data['story_beat'])
@@ -32,13 +41,75 @@ class Client:
             print(f"Error: {e}")
             raise e
         
-    def publish_statistics(self, stat: Statistics) -> None:
-        """Publish statistics to the server"""
+    def stream_new_story(self, on_text) -> StoryBeat:
+        """
+        Start a new story, calling on_text with the beat text received so far
+        while the server is still generating the rest of the beat.
+        """
+        response = requests.get(f"{self.base_url}/new/stream")
+        return self._read_story_stream(response, on_text)
+
+    def stream_update_story(self, choice_id: int, success_result: str, on_text) -> StoryBeat:
+        """Streaming version of update_story, see stream_new_story"""
+        response = requests.post(f"{self.base_url}/update/stream", json={"session_id": self.session_id, "choice_id": choice_id, "success_result": success_result})
+        return self._read_story_stream(response, on_text)
+
+    def _read_story_stream(self, response, on_text) -> StoryBeat:
+        """Read server-sent events until the final story beat arrives"""
+        text = ""
+        event = None
+        try:
+            while True:
+                line = response.raw.readline()
+                if not line:
+                    break
+                line = line.decode().strip()
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:])
+                    if event == "text":
+                        text += data
+                        on_text(text)
+                    elif event == "retry":
+                        text = ""
+                    elif event == "beat":
+                        self.session_id = data.get('session_id')
+                        return StoryBeat.from_dict(data['story_beat'])
+                    elif event == "error":
+                        raise ValueError(data['error'])
+        finally:
+            response.close()
+        raise ValueError("Story stream ended without a story beat")
+
+    def publish_statistics(self, stat: Statistics, buffered: bool = False) -> None:
+        """
+        Publish statistics to the server. Buffered statistics are held back
+        and sent in one request once STATS_BATCH_SIZE have been collected, or
+        along with the next unbuffered one or flush_statistics().
+        """
+        self._stats_buffer.append(stat)
+        if buffered and len(self._stats_buffer) < STATS_BATCH_SIZE:
+            return
+        self.flush_statistics()
+
+    def flush_statistics(self) -> None:
+        """Send all buffered statistics to the server"""
+        if not self._stats_buffer:
+            return
+        payload = [stat.to_dict() for stat in self._stats_buffer]
         try:
-            requests.post(f"{self.base_url}/stats", json=stat.to_dict())
-            print(f"Statistics published: {stat.to_dict()}")
+            if len(payload) == 1:
+                response = requests.post(f"{self.base_url}/stats", json=payload[0])
+            else:
+                response = requests.post(f"{self.base_url}/stats/batch", json=payload)
+            response.close()
+            self._stats_buffer = []
+            print(f"Statistics published: {payload}")
         except Exception as e:
             print(f"Error publishing statistics: {e}")
+            # Try again with the next flush, but don't let the buffer grow unbounded
+            self._stats_buffer = self._stats_buffer[-STATS_BUFFER_MAX:]
             raise e
 
 if __name__ == "__main__":
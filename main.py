@@ -241,12 +241,14 @@ def main():
         time.sleep_ms(50)
 
 def publish_interaction():
+    # Interactions aren't urgent, send them together with the next wakeup or batch
     client.publish_statistics(
                 Statistics(
                     STAT_INTERACTION,
                     0.0,
                     get_iso_timestamp(),
-                )
+                ),
+                buffered=True,
             )
 
 def should_wake_up(state: AlarmState) -> bool:
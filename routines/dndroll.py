@@ -3,6 +3,7 @@ import random
 from components.screen import Screen
 from components.pushbutton import PushButton
 from components.neopixelcircle import NeopixelCircle
+from server.models import SUCCESS_LEVELS
 
 INITIAL_VELOCITY = 50  # Initial velocity for the roll in milliseconds
 STOP_VELOCITY = 200  # Velocity at which the roll stops in milliseconds
@@ -22,7 +23,6 @@ FAILURE = 1
 CLOSE_CALL = 2
 SOLID_SUCCESS = 3
 TRIUMPH = 4
-SUCCESS_LEVELS = ["Disaster", "Failure", "Close Call", "Solid Success", "Triumph"]
 
 
 def dnd_roll(
@@ -17,6 +17,7 @@ from server.models import (
     MODE_ADVANTAGE,
     MODE_DISADVANTAGE,
     MODES_SYMBOLS,
+    PASSIVE_RESULT,
 )
 
 
@@ -32,7 +33,7 @@ def interactive_story(
     """
 
     message_wait_story(screen)
-    beat = client.get_new_story()
+    beat = client.stream_new_story(first_page_writer(screen))
     screen.set_cursor(False)
     while True:
         formatted_text = beat.beat_text.replace("\n", " ").strip()
@@ -68,12 +69,12 @@ def interactive_story(
         )  # +1 to match choice_id starting from 1
         choice = beat.choices[choice_id - 1]
         if choice.difficulty == 0:
-            success = "Passive choice selected."
+            success = PASSIVE_RESULT
         else:
             success = dnd_roll(choice.difficulty, choice.mode, screen, button, neopix)
         message_wait_story(screen)
         neopix.clear()
-        beat = client.update_story(choice_id, success)
+        beat = client.stream_update_story(choice_id, success, first_page_writer(screen))
         screen.set_cursor(False)
 
 
@@ -86,6 +87,26 @@ def message_wait_story(screen: Screen):
     screen.set_cursor_position(screen.rows // 2 - 1, last_letter_index)
 
 
+def first_page_writer(screen: Screen):
+    """
+    Returns a callback for streamed beat text that shows the first page on the
+    screen as soon as it is available, and leaves the screen alone after that.
+    """
+    state = {"rows": 0}
+
+    def on_text(text: str):
+        if state["rows"] >= screen.rows:
+            return
+        page = smart_wrap(text.replace("\n", " ").strip(), row_len=screen.cols, max_rows=screen.rows)
+        rows = page.count("\n") + 1
+        if rows > state["rows"]:
+            state["rows"] = rows
+            screen.set_cursor(False)
+            screen.message(page, autosplit=False)
+
+    return on_text
+
+
 if __name__ == "__main__":
     from components.pins import (
         PIN_SCREEN_SDA,
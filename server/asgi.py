@@ -0,0 +1,203 @@
+"""
+Production entry point for the server.
+
+    python asgi.py --host 0.0.0.0 --port 5000 --threads 16
+
+or with uvicorn directly: uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The device endpoints /new, /update, /stats and /stats/batch are served by
+async handlers: LLM work runs on the shared event loop and statistics are
+written on a worker thread, so slow requests don't hold up the rest. The
+dashboard's push stream /dashboard/events is async too, so open dashboards
+don't each hold a thread. Everything else
+(the streaming endpoints, /health and the Dash dashboard) is the Flask app
+from server.py, run on a pool of worker threads.
+
+Sessions, the beat pool and the speculator live in process memory, so the
+server runs as a single worker process; concurrency comes from the event
+loop and the thread pool.
+"""
+import argparse
+import asyncio
+from contextlib import asynccontextmanager
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.requests import Request
+from starlette.responses import JSONResponse, StreamingResponse
+from starlette.routing import Mount, Route
+import server
+from event_loop import shared_loop
+
+# Threads serving the Flask app (streaming, dashboard)
+DEFAULT_THREADS = 16
+# Seconds an idle keep-alive connection is held open. Longer than the
+# device's polling interval so each clock reuses one connection.
+KEEP_ALIVE_S = 75
+# Seconds in-flight requests get to finish on shutdown
+GRACEFUL_SHUTDOWN_S = 30
+
+
+async def new_story(request: Request):
+    """GET endpoint to start a new story"""
+    try:
+        session_id, story = server.sessions.create()
+        story_beat = await shared_loop().arun(
+            server.storyteller.anew_story(story, pool=server.opening_pool)
+        )
+        print(f"New story beat generated for session {session_id}: {story_beat.to_dict()}")
+        server.speculator.speculate(story)
+        return JSONResponse({
+            'success': True,
+            'session_id': session_id,
+            'story_beat': story_beat.to_dict()
+        })
+    except Exception as e:
+        print(e)
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+
+async def update_story(request: Request):
+    """POST endpoint to continue the story with a choice and result"""
+    try:
+        try:
+            data = await request.json()
+        except ValueError:
+            data = None
+        if not data:
+            return JSONResponse({
+                'success': False,
+                'error': 'No JSON data provided'
+            }, status_code=400)
+
+        choice_id = data.get('choice_id')
+        success_result = data.get('success_result')
+        session_id = data.get('session_id')
+        print(f"Received update request for session {session_id} with choice_id: {choice_id}, success_result: {success_result}")
+
+        if choice_id is None or success_result is None:
+            return JSONResponse({
+                'success': False,
+                'error': 'Missing required fields: choice_id and success_result'
+            }, status_code=400)
+
+        if not session_id:
+            return JSONResponse({
+                'success': False,
+                'error': 'Missing required field: session_id'
+            }, status_code=400)
+
+        try:
+            story = server.sessions.get(session_id)
+        except KeyError as e:
+            return JSONResponse({
+                'success': False,
+                'error': str(e)
+            }, status_code=404)
+
+        story_beat = await shared_loop().arun(server.storyteller.acontinue_story(
+            story, choice_id=choice_id, success_result=success_result, speculator=server.speculator
+        ))
+        print(f"Story beat updated: {story_beat.to_dict()}")
+        server.speculator.speculate(story)
+        return JSONResponse({
+            'success': True,
+            'session_id': session_id,
+            'story_beat': story_beat.to_dict()
+        })
+    except Exception as e:
+        print(e)
+        return JSONResponse({
+            'success': False,
+            'error': str(e)
+        }, status_code=500)
+
+
+async def post_stats(request: Request):
+    try:
+        stat = server.parse_statistic(await request.json())
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    server.handle_statistic(stat)
+    # SQLite blocks, keep it off the event loop
+    await asyncio.to_thread(server.db.insert, stat)
+    return JSONResponse({'status': 'ok'}, status_code=201)
+
+
+async def post_stats_batch(request: Request):
+    """POST endpoint for several statistics at once, stored in one transaction"""
+    try:
+        stats = server.parse_statistics_batch(await request.json())
+    except ValueError as e:
+        return JSONResponse({'error': str(e)}, status_code=400)
+
+    for stat in stats:
+        server.handle_statistic(stat)
+    await asyncio.to_thread(server.db.insert_many, stats)
+    return JSONResponse({'status': 'ok', 'count': len(stats)}, status_code=201)
+
+
+async def dashboard_events(request: Request):
+    """GET endpoint streaming changed sleep records, see DashboardApp.stream_events"""
+    # Builds the dashboard if this comes before any page load, off the event loop
+    dashboard = await asyncio.to_thread(server.get_dashboard)
+    return StreamingResponse(
+        dashboard.feed.astream(),
+        media_type='text/event-stream',
+        headers={'Cache-Control': 'no-cache'},
+    )
+
+
+@asynccontextmanager
+async def lifespan(app: Starlette):
+    server.startup()
+    yield
+    # Runs once the server has stopped accepting requests and in-flight
+    # requests have finished (or GRACEFUL_SHUTDOWN_S has passed)
+    print("Shutting down background workers")
+    await asyncio.to_thread(server.shutdown)
+
+
+def create_app(threads: int = DEFAULT_THREADS) -> Starlette:
+    return Starlette(
+        routes=[
+            Route('/new', new_story, methods=['GET']),
+            Route('/update', update_story, methods=['POST']),
+            Route('/stats', post_stats, methods=['POST']),
+            Route('/stats/batch', post_stats_batch, methods=['POST']),
+            Route('/dashboard/events', dashboard_events, methods=['GET']),
+            Mount('/', WSGIMiddleware(server.app, workers=threads)),
+        ],
+        lifespan=lifespan,
+    )
+
+
+app = create_app()
+
+
+if __name__ == '__main__':
+    import uvicorn
+
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--threads', type=int, default=DEFAULT_THREADS,
+                        help='threads serving the Flask app (streaming, dashboard)')
+    parser.add_argument('--keep-alive', type=int, default=KEEP_ALIVE_S,
+                        help='seconds idle keep-alive connections are held open')
+    parser.add_argument('--graceful-timeout', type=int, default=GRACEFUL_SHUTDOWN_S,
+                        help='seconds in-flight requests get to finish on shutdown')
+    args = parser.parse_args()
+
+    uvicorn.run(
+        create_app(args.threads),
+        host=args.host,
+        port=args.port,
+        workers=1,
+        timeout_keep_alive=args.keep_alive,
+        timeout_graceful_shutdown=args.graceful_timeout,
+        access_log=False,
+    )
@@ -0,0 +1,84 @@
+// Formatting done in the browser by the dashboard's clientside callbacks,
+// see DashboardApp._register_callbacks in dashboard.py
+window.dash_clientside = Object.assign({}, window.dash_clientside, {
+    dashboard: {
+        // 7.75 -> "7.8h"
+        formatHours: function (hours) {
+            if (hours === null || hours === undefined) {
+                return "-";
+            }
+            return hours.toFixed(1) + "h";
+        },
+
+        // Minutes after midnight, 1410.5 -> "23:30"
+        formatClock: function (minutes) {
+            if (minutes === null || minutes === undefined) {
+                return "-";
+            }
+            const pad = (n) => String(Math.floor(n)).padStart(2, "0");
+            return pad(minutes / 60) + ":" + pad(minutes % 60);
+        },
+
+        formatToday: function (today) {
+            const format = window.dash_clientside.dashboard;
+            if (!today) {
+                return ["-", "-", "-"];
+            }
+            return [
+                format.formatHours(today.sleep),
+                format.formatClock(today.bedtime),
+                format.formatClock(today.wakeup),
+            ];
+        },
+    },
+});
+
+// Sleep records pushed by the server as they change (DashboardApp.publish_nights).
+// A new latest night is appended straight to the graphs; the sleep-feed store
+// then has the update_from_feed callback fetch the new averages, or the
+// whole graphs if the night couldn't simply be appended.
+(function () {
+    const GRAPHS = ["sleep", "bedtime", "wakeup"];
+
+    function appendable(name, night) {
+        const graph = document.querySelector("#" + name + "-graph .js-plotly-plot");
+        if (!graph || !graph.data || !graph.layout.meta || graph.layout.meta.resolution !== "night") {
+            return false;
+        }
+        const x = graph.data[0].x || [];
+        return x.length === 0 || night.date > x[x.length - 1];
+    }
+
+    function onNight(night) {
+        const setProps = window.dash_clientside.set_props;
+        if (!setProps) {
+            return;
+        }
+        if (night.today) {
+            setProps("today-values", {data: night.values});
+        }
+        const extended = night.points !== null && GRAPHS.every((name) => appendable(name, night));
+        if (extended) {
+            for (const name of GRAPHS) {
+                const point = night.points[name];
+                setProps(name + "-graph", {
+                    extendData: [{x: [[night.date]], y: [[point.y]], text: [[point.text]]}, [0]],
+                });
+            }
+        }
+        setProps("sleep-feed", {data: {date: night.date, extended: extended}});
+    }
+
+    function connect() {
+        const config = JSON.parse(document.getElementById("_dash-config").textContent);
+        // EventSource reconnects by itself if the connection drops
+        const source = new EventSource(config.requests_pathname_prefix + "events");
+        source.addEventListener("sleep_record", (e) => onNight(JSON.parse(e.data)));
+    }
+
+    if (document.readyState === "loading") {
+        document.addEventListener("DOMContentLoaded", connect);
+    } else {
+        connect();
+    }
+})();
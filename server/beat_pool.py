@@ -0,0 +1,147 @@
+import json
+import os
+import threading
+from collections import deque
+from typing import Callable, Deque, Optional, Tuple
+from models import StoryBeat
+
+# Number of ready-made beats to keep around, and the level at which the
+# worker starts topping the pool back up.
+DEFAULT_TARGET_SIZE = 20
+DEFAULT_LOW_WATER = 5
+# Seconds to wait before retrying after the generator failed
+RETRY_DELAY_S = 30
+
+
+class BeatPool:
+    """
+    A warm pool of pre-generated story beats.
+    Beats are produced ahead of time by a background worker, persisted to disk
+    after every change so they survive restarts, and handed out with pop().
+    pop() never writes the file itself, so it is cheap enough for an event loop.
+    """
+
+    def __init__(
+        self,
+        generate: Callable[[], StoryBeat],
+        path: str = "opening_pool.json",
+        target_size: int = DEFAULT_TARGET_SIZE,
+        low_water: int = DEFAULT_LOW_WATER,
+    ):
+        if low_water > target_size:
+            raise ValueError("low_water must not exceed target_size")
+        self.generate = generate
+        self.path = path
+        self.target_size = target_size
+        self.low_water = low_water
+        self._beats: Deque[StoryBeat] = deque()
+        self._lock = threading.Lock()
+        self._refill = threading.Event()
+        self._stop = threading.Event()
+        self._worker: Optional[threading.Thread] = None
+        # Changes made, and the latest change written to disk
+        self._version = 0
+        self._saved_version = 0
+        self._save_lock = threading.Lock()
+        self._load()
+
+    def pop(self) -> Optional[StoryBeat]:
+        """Take a ready-made beat, or None if the pool is empty."""
+        snapshot = None
+        with self._lock:
+            beat = self._beats.popleft() if self._beats else None
+            remaining = len(self._beats)
+            if beat is not None:
+                snapshot = self._snapshot()
+        if snapshot:
+            threading.Thread(target=self._save, args=snapshot, name="beat-pool-save", daemon=True).start()
+        if remaining < self.low_water:
+            self._refill.set()
+        return beat
+
+    def start(self):
+        """Start the background worker that keeps the pool filled."""
+        if self._worker and self._worker.is_alive():
+            return
+        self._stop.clear()
+        self._refill.set()
+        self._worker = threading.Thread(target=self._run, name="beat-pool", daemon=True)
+        self._worker.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._refill.set()
+        if self._worker:
+            self._worker.join(timeout)
+
+    def __len__(self) -> int:
+        return len(self._beats)
+
+    def _run(self):
+        while not self._stop.is_set():
+            self._refill.wait()
+            self._refill.clear()
+            while not self._stop.is_set() and len(self._beats) < self.target_size:
+                try:
+                    beat = self.generate()
+                except Exception as e:
+                    print(f"Beat pool: failed to generate beat: {e}")
+                    self._stop.wait(RETRY_DELAY_S)
+                    continue
+                with self._lock:
+                    self._beats.append(beat)
+                    snapshot = self._snapshot()
+                self._save(*snapshot)
+                print(f"Beat pool: {len(self._beats)}/{self.target_size} beats ready")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path) as f:
+                data = json.load(f)
+            self._beats.extend(StoryBeat.from_dict(d) for d in data)
+            print(f"Beat pool: loaded {len(self._beats)} beats from {self.path}")
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Beat pool: ignoring unreadable pool file {self.path}: {e}")
+
+    def _snapshot(self) -> Tuple[int, list]:
+        """Number the current state of the pool for _save. Caller holds the lock."""
+        self._version += 1
+        return self._version, [beat.to_dict() for beat in self._beats]
+
+    def _save(self, version: int, data: list):
+        """Write a snapshot to disk atomically, unless a newer one was written already."""
+        with self._save_lock:
+            if version <= self._saved_version:
+                return
+            tmp_path = f"{self.path}.{os.getpid()}.tmp"
+            with open(tmp_path, "w") as f:
+                json.dump(data, f)
+            os.replace(tmp_path, self.path)
+            self._saved_version = version
+
+    def __repr__(self):
+        return f"BeatPool({len(self)}/{self.target_size} beats, low_water={self.low_water})"
+
+
+if __name__ == "__main__":
+    import time
+    from models import Choice
+
+    def fake_generate() -> StoryBeat:
+        time.sleep(0.1)
+        return StoryBeat("A door creaks open.", [Choice(1, "Enter", 3)], npcs=[])
+
+    pool = BeatPool(fake_generate, path="/tmp/beat_pool_demo.json", target_size=10, low_water=3)
+    pool.start()
+    time.sleep(1.5)
+
+    latencies = []
+    for _ in range(200):
+        start = time.perf_counter()
+        pool.pop()
+        latencies.append((time.perf_counter() - start) * 1000)
+    latencies.sort()
+    print(f"pop() latency p50={latencies[100]:.3f}ms p99={latencies[197]:.3f}ms")
+    pool.stop(timeout=1)
@@ -0,0 +1,144 @@
+"""
+Fuzz check and microbenchmark for the LLM JSON parser.
+
+Generates story beats, serialises them, breaks them the way LLMs do (code
+fences, prose around the object, unescaped quotes, raw newlines, trailing
+commas) and checks that parse_llm_json and the chunked TolerantJSONParser
+recover the original object. Then times both against the previous
+regex-based Storyteller.parse_llm_json_response on growing beats.
+"""
+import json
+import random
+import re
+import time
+from stream_parser import TolerantJSONParser, parse_llm_json
+
+N_FUZZ = 2000
+BENCH_SIZES = [1_000, 4_000, 16_000, 64_000]
+WORDS = ["blood", "shadow", "steel", "whisper,", "ember.", "crypt", "storm:", "oath", "{rune}", "[map]"]
+
+
+def legacy_parse(raw: str):
+    """The regex-based parser this module replaced, kept for comparison."""
+    raw = raw.strip()
+    raw = re.sub(r'^```(?:json|JSON)?\s*\n', '', raw)
+    raw = re.sub(r'\n```\s*$', '', raw)
+    if not raw.startswith(('{', '[')):
+        json_match = re.search(r'(\{[^{}]*\{[^{}]*\}[^{}]*\}|\{[^{}]+\})', raw, re.DOTALL)
+        if json_match:
+            raw = json_match.group(1)
+    try:
+        return json.loads(raw)
+    except json.JSONDecodeError as e:
+        fixed = re.sub(r'(?<!\\)"(?=(?:[^"]*"[^"]*")*[^"]*"[^"]*$)', r'\"', raw)
+        try:
+            return json.loads(fixed)
+        except Exception:
+            raise e
+
+
+def random_text(rng: random.Random, n_words: int) -> str:
+    words = []
+    for _ in range(n_words):
+        r = rng.random()
+        if r < 0.05:
+            # Quoted speech, followed by a word so the quote can be told apart
+            words.append(f'"{rng.choice(WORDS).strip(",.:")}!" she')
+        elif r < 0.08:
+            words.append("\n")
+        else:
+            words.append(rng.choice(WORDS))
+    return " ".join(words)
+
+
+def random_beat(rng: random.Random, n_words: int) -> dict:
+    return {
+        "beat": random_text(rng, n_words),
+        "choices": [f"{i},{rng.choice(WORDS).strip(',.:')},{rng.randint(0, 8)},{rng.choice([-1, 0, 1])}" for i in range(1, rng.randint(2, 5))],
+        "npcs": [rng.choice(["Lady Morwen", "The Ferryman"])],
+        "atmosphere": "grim",
+        "endstory": rng.random() < 0.1,
+    }
+
+
+def break_json(rng: random.Random, data: dict) -> str:
+    """Serialise a beat with the mistakes LLMs make."""
+    raw = json.dumps(data, indent=rng.choice([None, 2]))
+    # Unescaped quotes and raw newlines inside strings
+    if rng.random() < 0.5:
+        raw = raw.replace('\\"', '"')
+    if rng.random() < 0.5:
+        raw = raw.replace("\\n", "\n")
+    # Trailing commas
+    if rng.random() < 0.3:
+        raw = re.sub(r'"(\s*)\]', r'",\1]', raw)
+        raw = raw[: raw.rfind("}")] + ",}"
+    # Code fences or prose around the object
+    r = rng.random()
+    if r < 0.3:
+        raw = f"```json\n{raw}\n```"
+    elif r < 0.5:
+        raw = f"Here is the next beat:\n{raw}\nEnjoy!"
+    return raw
+
+
+def fuzz():
+    rng = random.Random(1)
+    legacy_failures = 0
+    for case in range(N_FUZZ):
+        data = random_beat(rng, rng.randint(5, 120))
+        raw = break_json(rng, data)
+        assert parse_llm_json(raw) == data, f"case {case}: {raw!r}"
+
+        parser = TolerantJSONParser()
+        i = 0
+        while i < len(raw):
+            step = rng.randint(1, 40)
+            parser.feed(raw[i : i + step])
+            i += step
+        assert parser.result() == data, f"chunked case {case}: {raw!r}"
+
+        try:
+            if legacy_parse(raw) != data:
+                legacy_failures += 1
+        except Exception:
+            legacy_failures += 1
+    print(f"Fuzz: {N_FUZZ} broken beats recovered, legacy parser failed on {legacy_failures}")
+
+
+def timed(parse, raw: str, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        try:
+            parse(raw)
+        except Exception:
+            pass
+    return (time.perf_counter() - start) / repeat * 1000
+
+
+def benchmark():
+    rng = random.Random(2)
+    print(f"{'chars':>8}{'legacy ms':>12}{'new ms':>10}{'chunked ms':>12}")
+    for size in BENCH_SIZES:
+        data = random_beat(rng, size // 6)
+        # Unescaped quotes force the legacy parser onto its repair path
+        raw = json.dumps(data).replace('\\"', '"')
+
+        def chunked(raw=raw):
+            parser = TolerantJSONParser()
+            for i in range(0, len(raw), 20):
+                parser.feed(raw[i : i + 20])
+            return parser.result()
+
+        repeat = max(1, 20_000 // size)
+        print(
+            f"{len(raw):>8}"
+            f"{timed(legacy_parse, raw, max(1, repeat // 10)):>12.2f}"
+            f"{timed(parse_llm_json, raw, repeat):>10.2f}"
+            f"{timed(chunked, raw, repeat):>12.2f}"
+        )
+
+
+if __name__ == "__main__":
+    fuzz()
+    benchmark()
@@ -0,0 +1,71 @@
+"""
+Token-count benchmark for the story history sent with every continuation.
+
+Plays synthetic stories of N_TURNS turns and reports the estimated input
+tokens of the continuation prompt per turn for three history policies:
+the full verbatim history, the condensed history window, and the window
+combined with the rolling LLM summary. No API keys are needed, summaries
+come from a stand-in LLM that returns a summary of realistic length.
+"""
+import random
+import time
+import storyteller as st
+from llm import LLM
+from models import StoryBeat, Choice
+from prompts import STORYTELLER_SYSTEM_PROMPT
+
+N_TURNS = 30
+BEAT_CHARS = 900
+SUMMARY_CHARS = 1200
+REPORT_TURNS = [1, 5, 10, 15, 20, 25, 30]
+
+
+class FakeSummaryLLM(LLM):
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        return "The hero " + "x" * (SUMMARY_CHARS - 9)
+
+    def __repr__(self):
+        return "Fake summariser"
+
+
+def synthetic_beat(i: int, rng: random.Random) -> StoryBeat:
+    words = ["blood", "shadow", "steel", "whisper", "ember", "crypt", "storm", "oath"]
+    text = f"Turn {i}. " + " ".join(rng.choice(words) for _ in range(BEAT_CHARS // 6))
+    choices = [Choice(c, f"Option {c} of turn {i}", rng.randint(0, 7)) for c in range(1, 5)]
+    return StoryBeat(text[:BEAT_CHARS], choices, npcs=["Lady Morwen"], atmosphere="grim")
+
+
+def play(storyteller: st.Storyteller, story: st.Story) -> list[int]:
+    rng = random.Random(42)
+    tokens = []
+    story.add_story_beat(synthetic_beat(0, rng))
+    for i in range(1, N_TURNS + 1):
+        choice = story.story_beats[-1].choices[0]
+        prompt = storyteller._continuation_prompt(story, choice.choice_id, "Solid Success")
+        # Each segment becomes a content block, and whitespace-only blocks are rejected
+        assert all(segment.strip() for segment in prompt.segments), f"whitespace-only segment on turn {i}"
+        tokens.append((len(STORYTELLER_SYSTEM_PROMPT) + len(prompt)) // st.CHARS_PER_TOKEN)
+        story.add_choice(choice, "Solid Success")
+        story.add_story_beat(synthetic_beat(i, rng))
+        storyteller.maybe_summarise(story)
+        # The summary normally arrives while the player reads; wait for it here
+        while story.summary_pending:
+            time.sleep(0.001)
+    return tokens
+
+
+if __name__ == "__main__":
+    st.VERBOSITY = st.LOW_VERBOSE
+    llm = FakeSummaryLLM()
+    policies = {
+        "verbatim": (st.Story(history_window=None), st.Storyteller(llm, summary_token_threshold=None)),
+        "window": (st.Story(), st.Storyteller(llm, summary_token_threshold=None)),
+        "window+summary": (st.Story(), st.Storyteller(llm)),
+    }
+    results = {name: play(storyteller, story) for name, (story, storyteller) in policies.items()}
+
+    print(f"Estimated input tokens per continuation ({N_TURNS} turns, {BEAT_CHARS} chars per beat)")
+    print(f"{'turn':>6}" + "".join(f"{name:>16}" for name in results))
+    for turn in REPORT_TURNS:
+        print(f"{turn:>6}" + "".join(f"{tokens[turn - 1]:>16}" for tokens in results.values()))
+    print(f"{'total':>6}" + "".join(f"{sum(tokens):>16}" for tokens in results.values()))
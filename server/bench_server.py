@@ -0,0 +1,102 @@
+"""
+Load test for the server: requests/sec and latency percentiles.
+
+Start the servers to compare, e.g. the development server and the
+production entry point on another port:
+
+    python server.py                  # http://127.0.0.1:5000
+    python asgi.py --port 5001        # http://127.0.0.1:5001
+
+then run
+
+    python bench_server.py --url http://127.0.0.1:5000 --url http://127.0.0.1:5001
+
+Each of --concurrency clients keeps one keep-alive connection open and sends
+requests back to back for --duration seconds. --path /stats posts statistics
+of type 'loadtest' to the database; --path /new generates real stories.
+"""
+import argparse
+import http.client
+import json
+import threading
+import time
+from datetime import datetime
+from urllib.parse import urlsplit
+
+PERCENTILES = [50, 90, 99]
+
+
+def request_args(path: str):
+    if path == '/stats':
+        body = json.dumps({'type': 'loadtest', 'value': 1, 'timestamp': datetime.now().isoformat()})
+        return 'POST', body, {'Content-Type': 'application/json'}
+    return 'GET', None, {}
+
+
+def client(url: str, path: str, deadline: float, latencies: list, errors: list):
+    parts = urlsplit(url)
+    conn = http.client.HTTPConnection(parts.hostname, parts.port or 80, timeout=60)
+    method, body, headers = request_args(path)
+    while time.perf_counter() < deadline:
+        start = time.perf_counter()
+        try:
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            if response.status >= 400:
+                errors.append(response.status)
+                continue
+        except (OSError, http.client.HTTPException) as e:
+            errors.append(type(e).__name__)
+            conn.close()
+            continue
+        latencies.append(time.perf_counter() - start)
+    conn.close()
+
+
+def percentile(sorted_values: list, p: float) -> float:
+    if not sorted_values:
+        return float('nan')
+    return sorted_values[min(len(sorted_values) - 1, int(p / 100 * len(sorted_values)))]
+
+
+def run(url: str, path: str, concurrency: int, duration: float) -> dict:
+    deadline = time.perf_counter() + duration
+    latencies: list = []
+    errors: list = []
+    threads = [
+        threading.Thread(target=client, args=(url, path, deadline, latencies, errors), daemon=True)
+        for _ in range(concurrency)
+    ]
+    start = time.perf_counter()
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - start
+    latencies.sort()
+    return {
+        'requests': len(latencies),
+        'errors': len(errors),
+        'rps': len(latencies) / elapsed,
+        **{f'p{p}': percentile(latencies, p) * 1000 for p in PERCENTILES},
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--url', action='append', help='server to test, can be repeated')
+    parser.add_argument('--path', default='/health', choices=['/health', '/stats', '/new'])
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    args = parser.parse_args()
+    urls = args.url or ['http://127.0.0.1:5000']
+
+    print(f"{args.path}, {args.concurrency} clients, {args.duration:.0f}s per server")
+    print(f"{'server':<28}{'req/s':>9}{'errors':>8}" + "".join(f"{f'p{p} ms':>10}" for p in PERCENTILES))
+    for url in urls:
+        result = run(url, args.path, args.concurrency, args.duration)
+        print(
+            f"{url:<28}{result['rps']:>9.1f}{result['errors']:>8}"
+            + "".join(f"{result[f'p{p}']:>10.1f}" for p in PERCENTILES)
+        )
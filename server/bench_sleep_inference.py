@@ -0,0 +1,130 @@
+"""
+Property check and benchmark for the vectorised sleep inference.
+
+Compares infer_sleep_periods with the previous loop-based implementation on
+random inputs (naive and aware timestamps, several time zones, duplicates,
+sub-second times, random evening starts) and checks that
+infer_sleep_periods_ms agrees on millisecond data. Then times both on years
+of per-minute interactions.
+"""
+import random
+import time as timer
+from bisect import bisect_left
+from datetime import datetime, time, timedelta, timezone
+import numpy as np
+from sleep_inference import SleepRecord, ensure_aware, infer_sleep_periods, infer_sleep_periods_ms
+
+N_CASES = 3000
+BENCH_DAYS = [30, 90, 365, 3 * 365]
+LEGACY_MAX_DAYS = 365
+START = datetime(2025, 1, 1)
+
+
+def legacy_infer_sleep_periods(interactions, wakeups, evening_start=time(18, 0)):
+    """The O(W*I) implementation infer_sleep_periods replaced."""
+    interactions = sorted((dt if dt.tzinfo else dt.replace(tzinfo=timezone.utc)) for dt in interactions)
+    wakeups = sorted((ensure_aware(dt) if dt.tzinfo is None else dt) for dt in wakeups)
+    records = []
+    seen_days = set()
+    for w in wakeups:
+        day = w.date()
+        if day in seen_days:
+            continue
+        seen_days.add(day)
+        idx = bisect_left(interactions, w)
+        preceding = interactions[:idx]
+        if not preceding:
+            continue
+        yesterday = day - timedelta(days=1)
+        prev_evening = [t for t in preceding if t.date() == yesterday and t.time() >= evening_start]
+        if prev_evening:
+            bedtime = max(prev_evening)
+        else:
+            early_morning = [t for t in preceding if t.date() == day]
+            if not early_morning:
+                continue
+            bedtime = min(early_morning)
+        records.append(SleepRecord(date=day, bedtime=bedtime, wakeup=w, duration=w - bedtime))
+    return records
+
+
+def as_tuples(records):
+    return [(r.date, r.bedtime, r.bedtime.utcoffset(), r.wakeup, r.wakeup.utcoffset(), r.duration) for r in records]
+
+
+def random_times(rng: random.Random, n: int, days: int, tz, sub_second: bool) -> list:
+    times = []
+    for _ in range(n):
+        t = START + timedelta(seconds=rng.randrange(days * 86400))
+        if sub_second:
+            t += timedelta(microseconds=rng.randrange(1_000_000))
+        times.append(t if tz is None else t.replace(tzinfo=tz))
+    # Exact duplicates and times right at day and evening boundaries
+    if times and rng.random() < 0.5:
+        times.append(rng.choice(times))
+    if rng.random() < 0.3:
+        day = START + timedelta(days=rng.randrange(days))
+        for edge in (day, day.replace(hour=18)):
+            times.append(edge if tz is None else edge.replace(tzinfo=tz))
+    rng.shuffle(times)
+    return times
+
+
+def to_ms(times: list) -> np.ndarray:
+    return np.array([(t - datetime(1970, 1, 1, tzinfo=timezone.utc)) // timedelta(milliseconds=1) for t in times], dtype=np.int64)
+
+
+def property_check():
+    rng = random.Random(7)
+    zones = [None, timezone.utc, timezone(timedelta(hours=2)), timezone(timedelta(hours=-5, minutes=-30))]
+    for case in range(N_CASES):
+        days = rng.randint(1, 20)
+        interaction_tz, wakeup_tz = rng.choice(zones), rng.choice(zones)
+        sub_second = rng.random() < 0.3
+        interactions = random_times(rng, rng.randint(0, 60), days, interaction_tz, sub_second)
+        wakeups = random_times(rng, rng.randint(0, 25), days, wakeup_tz, sub_second)
+        evening_start = time(rng.randrange(24), rng.choice([0, 30]))
+
+        expected = as_tuples(legacy_infer_sleep_periods(interactions, wakeups, evening_start))
+        assert as_tuples(infer_sleep_periods(interactions, wakeups, evening_start)) == expected, f"case {case}"
+
+        # Same data as epoch milliseconds, in one zone
+        if interaction_tz is not None and interaction_tz == wakeup_tz and not sub_second:
+            records = infer_sleep_periods_ms(to_ms(interactions), to_ms(wakeups), evening_start, interaction_tz.utcoffset(None))
+            assert as_tuples(records) == expected, f"ms case {case}"
+    print(f"Property check: {N_CASES} random cases identical to the previous implementation")
+
+
+def per_minute_data(days: int):
+    """An interaction every minute in the evening and night, a wakeup every morning."""
+    interactions, wakeups = [], []
+    for d in range(days):
+        evening = START.replace(tzinfo=timezone.utc) + timedelta(days=d, hours=19)
+        interactions += [evening + timedelta(minutes=m) for m in range(10 * 60)]
+        wakeups.append(evening + timedelta(hours=12))
+    return interactions, wakeups
+
+
+def benchmark():
+    print(f"{'days':>6}{'interactions':>14}{'legacy s':>10}{'datetime s':>12}{'ms arrays s':>13}")
+    for days in BENCH_DAYS:
+        interactions, wakeups = per_minute_data(days)
+        interactions_ms, wakeups_ms = to_ms(interactions), to_ms(wakeups)
+
+        legacy = "-"
+        if days <= LEGACY_MAX_DAYS:
+            start = timer.perf_counter()
+            legacy_infer_sleep_periods(interactions, wakeups)
+            legacy = f"{timer.perf_counter() - start:.3f}"
+        start = timer.perf_counter()
+        infer_sleep_periods(interactions, wakeups)
+        vectorised = timer.perf_counter() - start
+        start = timer.perf_counter()
+        infer_sleep_periods_ms(interactions_ms, wakeups_ms)
+        arrays = timer.perf_counter() - start
+        print(f"{days:>6}{len(interactions):>14}{legacy:>10}{vectorised:>12.3f}{arrays:>13.4f}")
+
+
+if __name__ == "__main__":
+    property_check()
+    benchmark()
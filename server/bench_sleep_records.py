@@ -0,0 +1,85 @@
+"""
+Benchmark for the materialised sleep_records table.
+
+Fills a database with a year of statistics (an interaction every minute from
+the evening into the night, a wakeup every morning), then times what the
+dashboard does per preset: inferring the sleep records from the raw
+statistics versus reading them from sleep_records. Also times the extra cost
+on ingest of keeping sleep_records up to date.
+
+    python bench_sleep_records.py --days 365
+"""
+import argparse
+import os
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from db import StatisticsDB
+from sleep_inference import infer_sleep_periods_ms
+from stats import STAT_INTERACTION, STAT_WAKEUP, Statistics
+
+N_DAYS = 365
+# Dashboard presets, in days
+WINDOWS = {"1w": 7, "1m": 30, "6m": 182, "12m": 365}
+REPEATS = 20
+
+
+def night(day: datetime) -> list[Statistics]:
+    evening = day + timedelta(hours=19)
+    stats = [
+        Statistics(STAT_INTERACTION, 1.0, (evening + timedelta(minutes=m)).isoformat())
+        for m in range(6 * 60)
+    ]
+    stats.append(Statistics(STAT_WAKEUP, 1.0, (evening + timedelta(hours=12)).isoformat()))
+    return stats
+
+
+def timed_ms(fn) -> float:
+    start = time.perf_counter()
+    for _ in range(REPEATS):
+        fn()
+    return (time.perf_counter() - start) / REPEATS * 1000
+
+
+def inferred(db: StatisticsDB, end: date, days: int):
+    """What the dashboard did before: query the raw statistics and infer."""
+    start = datetime.combine(end - timedelta(days=days + 1), datetime.min.time())
+    stop = datetime.combine(end, datetime.max.time())
+    interactions, _ = db.query_columns(STAT_INTERACTION, start=start, end=stop)
+    wakeups, _ = db.query_columns(STAT_WAKEUP, start=start, end=stop)
+    return infer_sleep_periods_ms(interactions, wakeups)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--days", type=int, default=N_DAYS)
+    args = parser.parse_args()
+
+    first = datetime(2025, 1, 1, tzinfo=timezone.utc)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = StatisticsDB(os.path.join(tmp, "bench.db"))
+        start = time.perf_counter()
+        for d in range(args.days):
+            db.insert_many(night(first + timedelta(days=d)))
+        print(f"Stored {args.days} nights in {time.perf_counter() - start:.1f}s")
+
+        # A late interaction and the next morning's wakeup, one row at a time
+        last = first + timedelta(days=args.days)
+        stats = night(last)
+        start = time.perf_counter()
+        for stat in stats:
+            db.insert(stat)
+        per_insert = (time.perf_counter() - start) / len(stats) * 1000
+        print(f"insert with sleep_records kept up to date: {per_insert:.3f} ms per row")
+
+        end = (last + timedelta(days=1)).date()
+        print(f"{'preset':>8}{'nights':>8}{'inferred ms':>13}{'table ms':>10}")
+        for name, days in WINDOWS.items():
+            records = db.query_sleep_records(end - timedelta(days=days + 1), end)
+            # The raw window cuts off the first night's evening, skip that night
+            assert [(r.bedtime, r.wakeup) for r in records[1:]] == [
+                (r.bedtime, r.wakeup) for r in inferred(db, end, days)[1:]
+            ]
+            before = timed_ms(lambda: inferred(db, end, days))
+            after = timed_ms(lambda: db.query_sleep_records(end - timedelta(days=days + 1), end))
+            print(f"{name:>8}{len(records):>8}{before:>13.2f}{after:>10.2f}")
@@ -0,0 +1,90 @@
+"""
+Start up benchmark: how long a fresh process takes to import the server, how
+long the first dashboard request takes after that, and which imports the
+time goes to (python -X importtime).
+
+    python bench_startup.py
+    python bench_startup.py --module asgi --top 20
+
+The LLM clients are created on first use, so placeholder API keys are used
+when none are set; nothing is sent to the providers. The processes run in a
+temporary directory so stats.db and the caches here are left alone.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+
+N_RUNS = 5
+TOP = 15
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+TIMED = """
+import time
+start = time.perf_counter()
+import {module}
+imported = time.perf_counter()
+import server
+server.app.test_client().get(server.DASHBOARD_PATH)
+print(imported - start, time.perf_counter() - imported)
+"""
+
+
+def env() -> dict:
+    environ = dict(os.environ)
+    environ["PYTHONPATH"] = os.pathsep.join(filter(None, [HERE, environ.get("PYTHONPATH")]))
+    environ.setdefault("OPENAI_API_KEY", "placeholder")
+    environ.setdefault("ANTHROPIC_API_KEY", "placeholder")
+    return environ
+
+
+def run(args: list, cwd: str) -> subprocess.CompletedProcess:
+    """Run python with args in cwd, which gets a link to the dashboard's assets."""
+    os.symlink(os.path.join(HERE, "assets"), os.path.join(cwd, "assets"))
+    return subprocess.run(
+        [sys.executable, *args], cwd=cwd, env=env(), capture_output=True, text=True, check=True
+    )
+
+
+def timed_run(module: str) -> tuple:
+    """Seconds to import module and then to serve the first dashboard page, in a fresh process."""
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(["-c", TIMED.format(module=module)], tmp)
+    imported, dashboard = result.stdout.strip().splitlines()[-1].split()
+    return float(imported), float(dashboard)
+
+
+def import_times(module: str) -> list:
+    """(cumulative µs, module) of each import made directly by module, slowest first."""
+    with tempfile.TemporaryDirectory() as tmp:
+        result = run(["-X", "importtime", "-c", f"import {module}"], tmp)
+    times = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line.split("|")
+        # Nesting is shown by indentation; keep the module and its direct imports
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if cumulative.strip().isdigit() and depth <= 1:
+            times.append((int(cumulative), name.strip()))
+    return sorted(times, reverse=True)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--module", default="server", help="module to import, e.g. server or asgi")
+    parser.add_argument("--runs", type=int, default=N_RUNS)
+    parser.add_argument("--top", type=int, default=TOP)
+    args = parser.parse_args()
+
+    runs = [timed_run(args.module) for _ in range(args.runs)]
+    imported = [r[0] for r in runs]
+    dashboard = [r[1] for r in runs]
+    print(f"import {args.module}: median {statistics.median(imported):.3f}s, min {min(imported):.3f}s")
+    print(f"first dashboard request: median {statistics.median(dashboard):.3f}s, min {min(dashboard):.3f}s")
+
+    print(f"\nSlowest imports (python -X importtime, cumulative):")
+    for cumulative, name in import_times(args.module)[: args.top]:
+        print(f"{cumulative / 1000:>10.1f} ms  {name}")
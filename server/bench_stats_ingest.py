@@ -0,0 +1,82 @@
+"""
+Ingestion benchmark for statistics: rows/sec stored one at a time
+(StatisticsDB.insert, as POST /stats does) versus in batches
+(StatisticsDB.insert_many, as POST /stats/batch does).
+
+    python bench_stats_ingest.py
+    python bench_stats_ingest.py --url http://127.0.0.1:5000
+
+With --url the same comparison is made over HTTP against a running server.
+The rows are of type 'benchmark'; over HTTP they end up in its database.
+"""
+import argparse
+import json
+import os
+import tempfile
+import time
+import urllib.request
+from datetime import datetime, timedelta
+from db import StatisticsDB
+from stats import Statistics
+
+N_ROWS = 5000
+BATCH_SIZES = [10, 100, 1000]
+
+
+def synthetic_stats(n: int) -> list[Statistics]:
+    start = datetime(2025, 6, 24, 8, 0, 0)
+    return [Statistics('benchmark', float(i % 60), (start + timedelta(minutes=i)).isoformat()) for i in range(n)]
+
+
+def batches(stats: list, size: int):
+    for i in range(0, len(stats), size):
+        yield stats[i : i + size]
+
+
+def rows_per_s(store, stats: list) -> float:
+    start = time.perf_counter()
+    store(stats)
+    return len(stats) / (time.perf_counter() - start)
+
+
+def bench_db(n: int):
+    stats = synthetic_stats(n)
+    with tempfile.TemporaryDirectory() as tmp:
+        db = StatisticsDB(os.path.join(tmp, 'bench.db'))
+        print(f"StatisticsDB, {n} rows")
+        rate = rows_per_s(lambda rows: [db.insert(stat) for stat in rows], stats)
+        print(f"{'insert':>20}{rate:>12.0f} rows/s")
+        for size in BATCH_SIZES:
+            rate = rows_per_s(lambda rows: [db.insert_many(batch) for batch in batches(rows, size)], stats)
+            print(f"{f'insert_many({size})':>20}{rate:>12.0f} rows/s")
+
+
+def post(url: str, payload):
+    request = urllib.request.Request(
+        url, data=json.dumps(payload).encode(), headers={'Content-Type': 'application/json'}
+    )
+    with urllib.request.urlopen(request) as response:
+        response.read()
+
+
+def bench_http(base_url: str, n: int):
+    stats = synthetic_stats(n)
+    print(f"HTTP {base_url}, {n} rows")
+    rate = rows_per_s(lambda rows: [post(f"{base_url}/stats", stat.to_dict()) for stat in rows], stats)
+    print(f"{'/stats':>20}{rate:>12.0f} rows/s")
+    for size in BATCH_SIZES:
+        rate = rows_per_s(
+            lambda rows: [post(f"{base_url}/stats/batch", [s.to_dict() for s in batch]) for batch in batches(rows, size)],
+            stats,
+        )
+        print(f"{f'/stats/batch({size})':>20}{rate:>12.0f} rows/s")
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--rows', type=int, default=N_ROWS)
+    parser.add_argument('--url', help='also benchmark a running server')
+    args = parser.parse_args()
+    bench_db(args.rows)
+    if args.url:
+        bench_http(args.url.rstrip('/'), args.rows)
@@ -0,0 +1,107 @@
+"""
+Query benchmark for the statistics table before and after the epoch-ms,
+(type, timestamp)-indexed schema.
+
+Builds a database of N_ROWS synthetic statistics in the original schema (ISO
+text timestamps, no index), times the dashboard's queries against it, lets
+StatisticsDB migrate it, and times the same queries with StatisticsDB.query
+and StatisticsDB.query_columns.
+
+    python bench_stats_query.py --rows 10000000
+
+query() formats ISO timestamps in SQL, which the original schema stored as
+text, so on ranges returning every row of a type it only matches the
+original; query_columns is where long ranges get faster.
+
+Needs about 1 GB of disk space for 10M rows.
+"""
+import argparse
+import os
+import sqlite3
+import tempfile
+import time
+from datetime import datetime, timedelta
+from db import StatisticsDB
+from stats import STAT_INTERACTION, STAT_WAKEUP, Statistics
+
+N_ROWS = 10_000_000
+# Dashboard presets, in days
+WINDOWS = {"1w": 7, "1m": 30, "12m": 365}
+TYPES = [STAT_INTERACTION, STAT_INTERACTION, STAT_INTERACTION, STAT_WAKEUP, "loadtest"]
+END = datetime(2025, 6, 30)
+STEP = timedelta(seconds=30)
+
+
+def build_legacy_db(path: str, n: int):
+    """The original schema, filled with one statistic every STEP up to END."""
+    conn = sqlite3.connect(path)
+    conn.execute("""
+        CREATE TABLE statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            value REAL NOT NULL,
+            timestamp DATETIME NOT NULL
+        )
+    """)
+    start = END - n * STEP
+    rows = (
+        (TYPES[i % len(TYPES)], float(i % 60), (start + i * STEP).isoformat())
+        for i in range(n)
+    )
+    with conn:
+        conn.executemany("INSERT INTO statistics (type, value, timestamp) VALUES (?, ?, ?)", rows)
+    conn.close()
+
+
+def legacy_query(conn: sqlite3.Connection, stat_type: str, start: datetime, end: datetime) -> int:
+    """The original StatisticsDB.query, returning the row count."""
+    rows = conn.execute("""
+        SELECT type, value, timestamp
+          FROM statistics
+        WHERE type = ? AND timestamp >= ? AND timestamp <= ?
+        ORDER BY timestamp ASC
+    """, (stat_type, start.isoformat(), end.isoformat())).fetchall()
+    return len([Statistics(stat_type=t, value=v, timestamp=ts) for t, v, ts in rows])
+
+
+def timed(query) -> tuple:
+    start = time.perf_counter()
+    count = query()
+    return (time.perf_counter() - start) * 1000, count
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--rows", type=int, default=N_ROWS)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "bench.db")
+        start = time.perf_counter()
+        build_legacy_db(path, args.rows)
+        print(f"Built {args.rows} rows in {time.perf_counter() - start:.1f}s")
+
+        conn = sqlite3.connect(path)
+        before = {
+            name: timed(lambda days=days: legacy_query(conn, STAT_WAKEUP, END - timedelta(days=days), END))
+            for name, days in WINDOWS.items()
+        }
+        conn.close()
+
+        start = time.perf_counter()
+        db = StatisticsDB(path)
+        print(f"Migrated in {time.perf_counter() - start:.1f}s")
+        after = {
+            name: timed(lambda days=days: len(db.query(STAT_WAKEUP, start=END - timedelta(days=days), end=END)))
+            for name, days in WINDOWS.items()
+        }
+        columns = {
+            name: timed(lambda days=days: len(db.query_columns(STAT_WAKEUP, start=END - timedelta(days=days), end=END)[0]))
+            for name, days in WINDOWS.items()
+        }
+        db.close()
+
+        print(f"{'window':>8}{'rows':>10}{'before ms':>12}{'after ms':>12}{'columns ms':>12}")
+        for name in WINDOWS:
+            (before_ms, count), (after_ms, _), (columns_ms, _) = before[name], after[name], columns[name]
+            print(f"{name:>8}{count:>10}{before_ms:>12.1f}{after_ms:>12.1f}{columns_ms:>12.1f}")
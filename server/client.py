@@ -1,9 +1,11 @@
 import requests
+import json
 from models import StoryBeat
 
 class Client:
     def __init__(self, base_url="http://localhost:5000"):
         self.base_url = base_url
+        self.session_id = None
 
     def get_new_story(self) -> StoryBeat:
         """Get a new story from the API"""
@@ -11,6 +13,7 @@ class Client:
             response = requests.get(f"{self.base_url}/new")
             response.raise_for_status()
             data = response.json()
+            self.session_id = data.get('session_id')
             beat = StoryBeat.from_dict(data['story_beat'])
             return beat
         except Exception as e:
@@ -20,7 +23,7 @@ class Client:
     def update_story(self, choice_id: int, success_result: str) -> StoryBeat:
         """Update the story with a choice and result"""
         try:
-            response = requests.post(f"{self.base_url}/update", json={"choice_id": choice_id, "success_result": success_result})
+            response = requests.post(f"{self.base_url}/update", json={"session_id": self.session_id, "choice_id": choice_id, "success_result": success_result})
             response.raise_for_status()
             data = response.json()
             beat = StoryBeat.from_dict(data['story_beat'])
@@ -28,6 +31,39 @@ class Client:
         except Exception as e:
             print(f"Error: {e}")
             raise e
+    def stream_new_story(self, on_text) -> StoryBeat:
+        """Start a new story, calling on_text with the beat text received so far while it is generated"""
+        response = requests.get(f"{self.base_url}/new/stream", stream=True)
+        response.raise_for_status()
+        return self._read_story_stream(response, on_text)
+
+    def stream_update_story(self, choice_id: int, success_result: str, on_text) -> StoryBeat:
+        """Streaming version of update_story, see stream_new_story"""
+        response = requests.post(f"{self.base_url}/update/stream", json={"session_id": self.session_id, "choice_id": choice_id, "success_result": success_result}, stream=True)
+        response.raise_for_status()
+        return self._read_story_stream(response, on_text)
+
+    def _read_story_stream(self, response, on_text) -> StoryBeat:
+        """Read server-sent events until the final story beat arrives"""
+        text = ""
+        event = None
+        with response:
+            for line in response.iter_lines(decode_unicode=True):
+                if line.startswith("event:"):
+                    event = line[6:].strip()
+                elif line.startswith("data:"):
+                    data = json.loads(line[5:])
+                    if event == "text":
+                        text += data
+                        on_text(text)
+                    elif event == "retry":
+                        text = ""
+                    elif event == "beat":
+                        self.session_id = data.get('session_id')
+                        return StoryBeat.from_dict(data['story_beat'])
+                    elif event == "error":
+                        raise ValueError(data['error'])
+        raise ValueError("Story stream ended without a story beat")
 
 if __name__ == "__main__":
     client = Client()
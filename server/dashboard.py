@@ -1,12 +1,75 @@
-from dash import Dash, dcc, html
-import plotly.express as px
+from dash import Dash, Patch, dcc, html
 from db import StatisticsDB
-from stats import STAT_INTERACTION, STAT_WAKEUP
 import re
+import threading
 import datetime as dt
-from dash.dependencies import Input, Output
-from sleep_inference import infer_sleep_periods, SleepRecord
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Any, Callable
+from dash.dependencies import ClientsideFunction, Input, Output, State
+from flask import Response
+from event_feed import EventFeed
+from sleep_inference import SleepRecord
 SLEEP, BEDTIME, WAKEUP = range(3)
+# Name of each metric in the layout's ids, e.g. "bedtime-graph", "avg-bedtime"
+METRICS = {SLEEP: "sleep", BEDTIME: "bedtime", WAKEUP: "wakeup"}
+# Dashboard results kept, a few presets for the current day and data
+CACHE_ENTRIES = 16
+# Resolutions of the graphs and their length in days. The finest one that
+# keeps a graph under MAX_POINTS points is used.
+RESOLUTIONS = [("night", 1), ("week", 7), ("month", 30)]
+MAX_POINTS = 40
+
+
+def utc_today() -> dt.date:
+    """Today in UTC, the calendar sleep records are dated in, whatever the host's time zone."""
+    return dt.datetime.now(dt.timezone.utc).date()
+
+
+class FigureCache:
+    """
+    LRU cache of dashboard callback results. Concurrent requests for the same
+    key wait for the first one to compute it instead of computing it again.
+    """
+
+    def __init__(self, max_entries: int = CACHE_ENTRIES):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[tuple, Future]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: tuple, compute: Callable[[], Any]) -> Any:
+        with self._lock:
+            future = self._entries.get(key)
+            owner = future is None
+            if owner:
+                future = self._entries[key] = Future()
+                self.misses += 1
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+            else:
+                self._entries.move_to_end(key)
+                self.hits += 1
+
+        if owner:
+            try:
+                future.set_result(compute())
+            except BaseException as e:
+                # Don't cache failures, the next request tries again
+                with self._lock:
+                    if self._entries.get(key) is future:
+                        del self._entries[key]
+                future.set_exception(e)
+        return future.result()
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
 
 
 class DashboardApp:
@@ -18,114 +81,188 @@ class DashboardApp:
         self.app.layout = self._build_layout()
         self._register_callbacks()
         self.db = db
+        self.cache = FigureCache()
+
+        # Changed sleep records are pushed to open dashboards, see assets/dashboard.js
+        self.feed = EventFeed()
+        self.db.add_listener(self.publish_nights)
+        server.add_url_rule(
+            f"{url_base_pathname}events", "dashboard_events", self.stream_events
+        )
 
     def _register_callbacks(self):
+        # Each graph is updated on its own, with a Patch of its data and
+        # ticks; the styling is sent once with the layout
+        for stat, name in METRICS.items():
+            @self.app.callback(
+                Output(f"{name}-graph", "figure"),
+                Output(f"avg-{name}-value", "data"),
+                Input("preset-date-range", "value"),
+            )
+            def update_trend(preset, stat=stat):
+                data = self.cached_sleep_graph_data(preset)
+                patch = self.trend_patch(data[stat], data["show_date"], data["resolution"])
+                return patch, data["averages"][stat]
+
+            # Formatting the averages is left to the browser, see assets/dashboard.js
+            self.app.clientside_callback(
+                ClientsideFunction("dashboard", "formatHours" if stat == SLEEP else "formatClock"),
+                Output(f"avg-{name}", "children"),
+                Input(f"avg-{name}-value", "data"),
+            )
+
+        # A night pushed by the feed (see publish_nights). The browser has
+        # appended it to the graphs if it could ("extended"); what's left is
+        # the averages and ticks, or the whole graphs if it couldn't.
         @self.app.callback(
-            # Row 1 - Averages
+            *[Output(f"{name}-graph", "figure", allow_duplicate=True) for name in METRICS.values()],
+            *[Output(f"avg-{name}-value", "data", allow_duplicate=True) for name in METRICS.values()],
+            Input("sleep-feed", "data"),
+            State("preset-date-range", "value"),
+            prevent_initial_call=True,
+        )
+        def update_from_feed(event, preset):
+            data = self.cached_sleep_graph_data(preset)
+            if event["extended"]:
+                patches = [self.ticks_patch(data[stat]) for stat in METRICS]
+            else:
+                patches = [self.trend_patch(data[stat], data["show_date"], data["resolution"]) for stat in METRICS]
+            return *patches, *[data["averages"][stat] for stat in METRICS]
+
+        # Today's stats don't depend on the preset, they're loaded with the page
+        @self.app.callback(
+            Output("today-values", "data"),
+            Input("today-stats-title", "id"),
+        )
+        def update_today(_):
+            return self.today_values()
+
+        self.app.clientside_callback(
+            ClientsideFunction("dashboard", "formatToday"),
             Output("today-sleep", "children"),
             Output("today-gotobed", "children"),
             Output("today-wakeup", "children"),
-
-            # Row 2 - Sleep Graph
-            Output("sleep-graph", "figure"),
-            Output("avg-sleep", "children"),
-
-            # Row 3 - Bedtime Graph
-            Output("bedtime-graph", "figure"),
-            Output("avg-bedtime", "children"),
-
-            # Row 4 - Wakeup Graph
-            Output("wakeup-graph", "figure"),
-            Output("avg-wakeup", "children"),
-
-            # Inputs
-            Input("preset-date-range", "value"),
+            Input("today-values", "data"),
         )
-        def update_sleep_graph(preset):
-            # Map your presets to days
-            presets = {"1w": 7, "2w": 14, "1m": 30, "6m": 182, "12m": 365}
-            days = presets.get(preset, 7)
-            interaction_times, wakeup_times = self.get_times_from_db(days)
-            sleep_records = infer_sleep_periods(interaction_times, wakeup_times)
-            if not sleep_records:
-                return "-", "-", "-", self.plot_sleep([])
-
-            # Averages and today's values
-            today = dt.date.today()
-            today_record = next(
-                (record for record in sleep_records if record.date == today),
-                None
-            )
-            if today_record:
-                today_sleep = f"{today_record.duration.total_seconds() / 3600 :.1f}h"
-                today_gotobed = today_record.bedtime.strftime("%H:%M")
-                today_wakeup = today_record.wakeup.strftime("%H:%M")
-            else:
-                today_sleep = "-"
-                today_gotobed = "-"
-                today_wakeup = "-"
 
-            # Calculate averages
-            total_sleep = sum(
-                record.duration.total_seconds() for record in sleep_records
-            )
-            avg_sleep = total_sleep / len(sleep_records) / 3600 if sleep_records else 0
-            avg_sleep_str = f"{avg_sleep:.1f}h"
-
-            avg_bedtime = (
-                sum(record.bedtime.hour * 60 + record.bedtime.minute for record in sleep_records) /
-                len(sleep_records)
-            ) if sleep_records else 0
-            avg_bedtime_str = f"{int(avg_bedtime // 60):02}:{int(avg_bedtime % 60):02}"
-
-            avg_wakeup = (
-                sum(record.wakeup.hour * 60 + record.wakeup.minute for record in sleep_records) /
-                len(sleep_records)
-            ) if sleep_records else 0
-            avg_wakeup_str = f"{int(avg_wakeup // 60):02}:{int(avg_wakeup % 60):02}"
-
-            # Plots
-            if days <= 7:
-                show_date = False
-            else:
-                show_date = True
-            sleep_fig = self.plot_line_trend(sleep_records, SLEEP, show_date)
-            bedtime_fig = self.plot_line_trend(
-                sleep_records, BEDTIME, show_date
-            )
-            wakeup_fig = self.plot_line_trend(
-                sleep_records, WAKEUP, show_date
-            )
+    def cached_sleep_graph_data(self, preset) -> dict:
+        # Results only change with the data, or when the day (and so the
+        # window) changes. The three graph callbacks share one computation.
+        key = (preset, utc_today(), self.db.sleep_version)
+        return self.cache.get(key, lambda: self.sleep_graph_data(preset))
+
+    def today_values(self) -> dict | None:
+        """Today's sleep in hours, and bedtime and wakeup in minutes after midnight."""
+        today = utc_today()
+        record = next(iter(self.db.query_sleep_records(today, today)), None)
+        return self.record_values(record)
+
+    @staticmethod
+    def record_values(record: SleepRecord | None) -> dict | None:
+        if record is None:
+            return None
+        return {
+            "sleep": record.duration.total_seconds() / 3600,
+            "bedtime": record.bedtime.hour * 60 + record.bedtime.minute,
+            "wakeup": record.wakeup.hour * 60 + record.wakeup.minute,
+        }
 
-            return (
-                today_sleep,
-                today_gotobed,
-                today_wakeup,
-                sleep_fig,
-                avg_sleep_str,
-                bedtime_fig,
-                avg_bedtime_str,
-                wakeup_fig,
-                avg_wakeup_str,
-            )
+    def publish_nights(self, nights: list[dt.date]):
+        """
+        Push nights whose sleep record changed to open dashboards. Each event
+        holds the night's values and its point on each trend graph, or null
+        if it no longer has a record.
+        """
+        if not len(self.feed):
+            return
+        today = utc_today()
+        for night in nights:
+            record = next(iter(self.db.query_sleep_records(night, night)), None)
+            points = None
+            if record is not None:
+                points = {}
+                for stat, name in METRICS.items():
+                    series = self.trend_series([record], stat)
+                    points[name] = {"y": series["y"][0], "text": series["text"][0]}
+            self.feed.publish("sleep_record", {
+                "date": night.isoformat(),
+                "today": night == today,
+                "values": self.record_values(record),
+                "points": points,
+            })
+
+    def stream_events(self):
+        """GET endpoint streaming changed sleep records as server-sent events"""
+        return Response(
+            self.feed.stream(),
+            mimetype="text/event-stream",
+            headers={"Cache-Control": "no-cache"},
+        )
 
-    def get_times_from_db(self, days):
-        
+    def sleep_graph_data(self, preset) -> dict:
+        """
+        The series of each trend graph (see trend_series), the raw average of
+        each metric (hours of sleep, minutes after midnight), the resolution
+        of the points and whether the x axes show dates.
+        """
+        # Map your presets to days
+        presets = {"1w": 7, "2w": 14, "1m": 30, "6m": 182, "12m": 365}
+        days = presets.get(preset, 7)
+        resolution = self.resolution(days)
+        weighted = self.get_sleep_records(days, resolution)
+        sleep_records = [record for record, _ in weighted]
+        data = {stat: self.trend_series(sleep_records, stat) for stat in METRICS}
+        data["show_date"] = days > 7
+        data["resolution"] = resolution
+        if not weighted:
+            data["averages"] = {stat: None for stat in METRICS}
+            return data
+
+        # Calculate averages, weeks and months by their number of nights
+        nights = sum(n for _, n in weighted)
+        total_sleep = sum(
+            record.duration.total_seconds() * n for record, n in weighted
+        )
+        avg_sleep = total_sleep / nights / 3600
+
+        # Relative to the night's midnight so that bedtimes either side of it
+        # average to around midnight instead of noon
+        avg_bedtime = sum(
+            self.minutes_after_midnight(record, record.bedtime) * n for record, n in weighted
+        ) / nights % (24 * 60)
+
+        avg_wakeup = sum(
+            self.minutes_after_midnight(record, record.wakeup) * n for record, n in weighted
+        ) / nights % (24 * 60)
+
+        data["averages"] = {SLEEP: avg_sleep, BEDTIME: avg_bedtime, WAKEUP: avg_wakeup}
+        return data
+
+    @staticmethod
+    def minutes_after_midnight(record: SleepRecord, t: dt.datetime) -> float:
+        """Minutes from the start of the record's date to t, negative the evening before."""
+        midnight = dt.datetime.combine(record.date, dt.time(), tzinfo=t.tzinfo)
+        return (t - midnight).total_seconds() / 60
+
+    @staticmethod
+    def resolution(days) -> str:
+        """The finest resolution that keeps graphs of the last days at most MAX_POINTS long."""
+        return next(
+            (name for name, length in RESOLUTIONS if days / length <= MAX_POINTS),
+            RESOLUTIONS[-1][0],
+        )
 
-        end_date = dt.datetime.now()
+    def get_sleep_records(self, days, resolution: str) -> list[tuple[SleepRecord, int]]:
+        """
+        Sleep records of the last days, each with the number of nights it
+        stands for: nightly records, or weekly or monthly averages. Kept up
+        to date on ingest, see StatisticsDB.
+        """
+        end_date = utc_today()
         start_date = end_date - dt.timedelta(days=days + 1)
-
-        interactions = self.db.query(STAT_INTERACTION, start=start_date, end=end_date)
-        interaction_times = [
-            dt.datetime.fromisoformat(interaction.timestamp)
-            for interaction in interactions
-        ]
-        wakeups = self.db.query(STAT_WAKEUP, start=start_date, end=end_date)
-        wakeup_times = [
-            dt.datetime.fromisoformat(wakeup.timestamp) for wakeup in wakeups
-        ]
-
-        return interaction_times, wakeup_times
+        if resolution == "night":
+            return [(record, 1) for record in self.db.query_sleep_records(start_date, end_date)]
+        return self.db.query_sleep_rollups(resolution, start_date, end_date)
 
     def _extract_colors(self):
         with open("assets/style.css") as f:
@@ -173,6 +310,8 @@ class DashboardApp:
                 html.Div(
                     children=[
                         html.H2("Today's stats", id="today-stats-title", className="dashboard-section-title"),
+                        dcc.Store(id="today-values"),
+                        dcc.Store(id="sleep-feed"),
                         html.Div(
                             children=[
                                 html.Div(
@@ -202,10 +341,11 @@ class DashboardApp:
                         html.H2("Sleep", className="dashboard-section-title"),
                         html.Div(
                             [
-                                html.Div([dcc.Graph(id="sleep-graph")], className="flex-plot"),
+                                html.Div([dcc.Graph(id="sleep-graph", figure=self.base_trend_figure())], className="flex-plot"),
                                 html.Div(
                                     [
                                         html.H2("-", id='avg-sleep', className="metric-value"),
+                                        dcc.Store(id='avg-sleep-value'),
                                         html.P("Average sleep", className="metric-label"),
                                     ],
                                     className="flex-item",
@@ -223,10 +363,11 @@ class DashboardApp:
                         html.H2("Bedtime", className="dashboard-section-title"),
                         html.Div(
                             [
-                                html.Div([dcc.Graph(id='bedtime-graph')], className="flex-plot"),
+                                html.Div([dcc.Graph(id='bedtime-graph', figure=self.base_trend_figure())], className="flex-plot"),
                                 html.Div(
                                     [
                                         html.H2("-", id='avg-bedtime', className="metric-value"),
+                                        dcc.Store(id='avg-bedtime-value'),
                                         html.P("Average bedtime", className="metric-label"),
                                     ],
                                     className="flex-item",
@@ -244,10 +385,11 @@ class DashboardApp:
                         html.H2("Wakeup", className="dashboard-section-title"),
                         html.Div(
                             [
-                                html.Div([dcc.Graph(id='wakeup-graph')], className="flex-plot"),
+                                html.Div([dcc.Graph(id='wakeup-graph', figure=self.base_trend_figure())], className="flex-plot"),
                                 html.Div(
                                     [
                                         html.H2("-", id='avg-wakeup', className="metric-value"),
+                                        dcc.Store(id='avg-wakeup-value'),
                                         html.P("Average wakeup", className="metric-label"),
                                     ],
                                     className="flex-item",
@@ -301,20 +443,15 @@ class DashboardApp:
 
         return fig
     
-    def plot_line_trend(self, sleep_records: list[SleepRecord], stat: int, show_date: bool):
-        """
-        Create a line trend plot for wakeup or bedtime.
-        """
-        import plotly.graph_objects as go
-
+    def trend_series(self, sleep_records: list[SleepRecord], stat: int) -> dict:
+        """x, y and hover text of a trend graph for sleep, bedtime or wakeup, and its y-axis ticks."""
         if stat == SLEEP:
             times = [
                 f"{rec.bedtime.time().strftime('%H:%M')} - {rec.wakeup.time().strftime('%H:%M')}"
                 for rec in sleep_records
             ]
             minutes = [
-                (rec.wakeup.hour * 60 + rec.wakeup.minute) - (rec.bedtime.hour * 60 + rec.bedtime.minute)
-                for rec in sleep_records
+                int(rec.duration.total_seconds() // 60) for rec in sleep_records
             ]
         elif stat == BEDTIME:
             times = [rec.bedtime.time().strftime("%H:%M") for rec in sleep_records]
@@ -327,27 +464,14 @@ class DashboardApp:
                 rec.wakeup.hour * 60 + rec.wakeup.minute for rec in sleep_records
             ]
 
-        days = [record.date for record in sleep_records]
-
-        fig = go.Figure()
-        fig.add_trace(
-            go.Scatter(
-                x=days,
-                y=minutes,
-                mode="lines+markers",
-                line=dict(color=self.colors["pop"]),
-                marker=dict(size=8),
-                text=times,
-                hovertemplate="%{x}<br>%{text}<extra></extra>",
-            )
-        )
+        days = [record.date.isoformat() for record in sleep_records]
 
-        if stat == SLEEP:
+        if not minutes:
+            yticks, yticklabels = [], []
+        elif stat == SLEEP:
             # Set y-axis to show sleep duration in hours
-            fig.update_yaxes(
-                tickvals=list(range(0, max(minutes) + 1, 30)),
-                ticktext=[f"{i // 60}h {i % 60}m" for i in range(0, max(minutes) + 1, 30)],
-            )
+            yticks = list(range(0, max(minutes) + 1, 30))
+            yticklabels = [f"{i // 60}h {i % 60}m" for i in yticks]
         else:
             # Set y-axis ticks to the times
             min_minute = min(minutes)
@@ -356,12 +480,53 @@ class DashboardApp:
             step = 30
             yticks = list(range((min_minute // step) * step, ((max_minute // step) + 1) * step + 1, step))
             yticklabels = [f"{h:02}:{m:02}" for h, m in [(m // 60, m % 60) for m in yticks]]
-            fig.update_yaxes(
-                tickvals=yticks,
-                ticktext=yticklabels,
+
+        return {"x": days, "y": minutes, "text": times, "tickvals": yticks, "ticktext": yticklabels}
+
+    def base_trend_figure(self, show_date: bool = False):
+        """A styled trend graph without data, see trend_series."""
+        import plotly.graph_objects as go
+
+        fig = go.Figure()
+        fig.add_trace(
+            go.Scatter(
+                x=[],
+                y=[],
+                mode="lines+markers",
+                line=dict(color=self.colors["pop"]),
+                marker=dict(size=8),
+                text=[],
+                hovertemplate="%{x}<br>%{text}<extra></extra>",
             )
+        )
+        return self.format_fig(fig, show_date)
+
+    def trend_patch(self, series: dict, show_date: bool, resolution: str) -> Patch:
+        """Update a graph made by base_trend_figure to show series, without resending its styling."""
+        patch = self.ticks_patch(series)
+        patch["data"][0]["x"] = series["x"]
+        patch["data"][0]["y"] = series["y"]
+        patch["data"][0]["text"] = series["text"]
+        patch["layout"]["xaxis"]["tickformat"] = self.date_tick_format(show_date)
+        # Tells the browser whether pushed nights can be appended as points
+        patch["layout"]["meta"] = {"resolution": resolution}
+        return patch
+
+    def ticks_patch(self, series: dict) -> Patch:
+        """Update just the y-axis ticks of a trend graph."""
+        patch = Patch()
+        patch["layout"]["yaxis"]["tickvals"] = series["tickvals"]
+        patch["layout"]["yaxis"]["ticktext"] = series["ticktext"]
+        return patch
 
-        fig = self.format_fig(fig, show_date)
+    def plot_line_trend(self, sleep_records: list[SleepRecord], stat: int, show_date: bool):
+        """
+        Create a line trend plot for sleep, wakeup or bedtime.
+        """
+        series = self.trend_series(sleep_records, stat)
+        fig = self.base_trend_figure(show_date)
+        fig.update_traces(x=series["x"], y=series["y"], text=series["text"])
+        fig.update_yaxes(tickvals=series["tickvals"], ticktext=series["ticktext"])
         return fig
 
 
@@ -406,6 +571,10 @@ class DashboardApp:
 
         return fig
 
+    @staticmethod
+    def date_tick_format(show_date: bool) -> str:
+        return "%a %d %b" if show_date else "%A"  # e.g. "Mon 01 Jan"
+
     def format_fig(self, fig, show_date: bool = True):
         fig.update_layout(
             paper_bgcolor=self.colors["bg"],  # outer background
@@ -424,7 +593,7 @@ class DashboardApp:
                 zerolinecolor=self.colors["mg"],  # <-- Color of x=0 line
                 zerolinewidth=2,  # <-- Optional: thickness
                 title=dict(font=dict(size=22)),
-                tickformat="%a %d %b" if show_date else "%A",  # e.g. "Mon 01 Jan"
+                tickformat=self.date_tick_format(show_date),
             ),
             yaxis=dict(
                 showgrid=True,
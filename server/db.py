@@ -1,51 +1,351 @@
 # db.py
 import sqlite3
-from datetime import datetime
-from typing import List, Optional, Tuple
-from stats import Statistics
+import threading
+import numpy as np
+from datetime import date, datetime, time, timedelta, timezone
+from typing import Callable, Iterable, List, Optional, Tuple
+from stats import STAT_INTERACTION, STAT_WAKEUP, Statistics
+from sleep_inference import SleepRecord, infer_sleep_periods_ms
+
+# Seconds a statement waits for a lock held by another connection before
+# failing with "database is locked"
+BUSY_TIMEOUT_S = 5.0
+# Statements kept compiled per connection; the few distinct queries are
+# prepared once and reused
+CACHED_STATEMENTS = 64
+PRAGMAS = [
+    # Readers (dashboard) and the writer (ingestion) don't block each other
+    "PRAGMA journal_mode=WAL",
+    # Safe with WAL, only syncs at checkpoints instead of every commit
+    "PRAGMA synchronous=NORMAL",
+    # 16 MB page cache per connection
+    "PRAGMA cache_size=-16000",
+    # Read through a 256 MB memory map instead of read() calls
+    "PRAGMA mmap_size=268435456",
+    "PRAGMA temp_store=MEMORY",
+]
+INSERT_SQL = "INSERT INTO statistics (type, value, timestamp) VALUES (?, ?, ?)"
+SLEEP_RECORD_INSERT_SQL = "INSERT INTO sleep_records (date, bedtime, wakeup) VALUES (?, ?, ?)"
+# Average night of a period, times in ms after midnight of each night's date
+# (negative for a bedtime the evening before)
+SLEEP_ROLLUP_INSERT_SQL = """
+    INSERT INTO sleep_rollups (resolution, period, nights, bedtime, wakeup)
+    SELECT ?, ?, COUNT(*),
+           AVG(bedtime - strftime('%s', date) * 1000),
+           AVG(wakeup - strftime('%s', date) * 1000)
+      FROM sleep_records
+    WHERE date >= ? AND date < ?
+    HAVING COUNT(*) > 0
+"""
+# Periods averaged in sleep_rollups. The nightly resolution is sleep_records itself.
+ROLLUP_RESOLUTIONS = ("week", "month")
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+_MS = timedelta(milliseconds=1)
+DAY_MS = 24 * 60 * 60 * 1000
+
+
+def to_epoch_ms(ts: datetime) -> int:
+    """Milliseconds since the epoch. Naive datetimes are taken to be UTC."""
+    if ts.tzinfo is None:
+        ts = ts.replace(tzinfo=timezone.utc)
+    return (ts - EPOCH) // _MS
+
+
+def from_epoch_ms(ms: int) -> str:
+    """ISO timestamp (UTC) of milliseconds since the epoch."""
+    return (EPOCH + ms * _MS).isoformat()
+
+
+# from_epoch_ms in SQL, much faster than converting each row in Python
+ISO_TIMESTAMP_SQL = """
+    strftime('%Y-%m-%dT%H:%M:%S', timestamp / 1000, 'unixepoch')
+    || CASE WHEN timestamp % 1000 THEN printf('.%03d000', timestamp % 1000) ELSE '' END
+    || '+00:00'
+"""
+
+
+def _iso_to_epoch_ms(ts: str) -> Optional[int]:
+    try:
+        return to_epoch_ms(datetime.fromisoformat(ts))
+    except (TypeError, ValueError):
+        return None
+
+
+def _create_statistics(conn: sqlite3.Connection):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS statistics (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            value REAL NOT NULL,
+            timestamp DATETIME NOT NULL
+        )
+    """)
+
+
+def _epoch_ms_timestamps(conn: sqlite3.Connection):
+    """Store timestamps as integer epoch milliseconds and index (type, timestamp)."""
+    conn.create_function("iso_to_epoch_ms", 1, _iso_to_epoch_ms, deterministic=True)
+    conn.execute("""
+        CREATE TABLE statistics_new (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            type TEXT NOT NULL,
+            value REAL NOT NULL,
+            timestamp INTEGER NOT NULL
+        )
+    """)
+    # Backfill, rows with unreadable timestamps can't be placed in time
+    copied = conn.execute("""
+        INSERT INTO statistics_new (id, type, value, timestamp)
+        SELECT id, type, value, iso_to_epoch_ms(timestamp)
+          FROM statistics
+         WHERE iso_to_epoch_ms(timestamp) IS NOT NULL
+    """).rowcount
+    (total,) = conn.execute("SELECT COUNT(*) FROM statistics").fetchone()
+    if copied < total:
+        print(f"Dropped {total - copied} statistics with unreadable timestamps")
+    conn.execute("DROP TABLE statistics")
+    conn.execute("ALTER TABLE statistics_new RENAME TO statistics")
+    conn.execute("CREATE INDEX statistics_type_timestamp ON statistics (type, timestamp)")
+
+
+def _times_ms(conn: sqlite3.Connection, stat_type: str, start: int, end: int) -> np.ndarray:
+    """Sorted epoch-ms timestamps of a type in [start, end)."""
+    cursor = conn.execute("""
+        SELECT timestamp
+          FROM statistics
+        WHERE type = ? AND timestamp >= ? AND timestamp < ?
+        ORDER BY timestamp ASC
+    """, (stat_type, start, end))
+    return np.fromiter((ts for (ts,) in cursor), dtype=np.int64)
+
+
+def _infer_nights(conn: sqlite3.Connection, first: int, last: int) -> List[Tuple[str, int, int]]:
+    """
+    (date, bedtime, wakeup) rows of the nights whose wakeup falls on the UTC
+    days first..last (days since the epoch), inferred from the statistics.
+    """
+    wakeups = _times_ms(conn, STAT_WAKEUP, first * DAY_MS, (last + 1) * DAY_MS)
+    if not len(wakeups):
+        return []
+    # A bedtime is at most the evening before the wakeup
+    interactions = _times_ms(conn, STAT_INTERACTION, (first - 1) * DAY_MS, (last + 1) * DAY_MS)
+    return [
+        (record.date.isoformat(), to_epoch_ms(record.bedtime), to_epoch_ms(record.wakeup))
+        for record in infer_sleep_periods_ms(interactions, wakeups)
+    ]
+
+
+def _period(day: date, resolution: str) -> Tuple[date, date]:
+    """First day of the week (from Monday) or month containing day, and of the next."""
+    if resolution == "week":
+        start = day - timedelta(days=day.weekday())
+        return start, start + timedelta(days=7)
+    start = day.replace(day=1)
+    return start, (start + timedelta(days=32)).replace(day=1)
+
+
+def _refresh_rollups(conn: sqlite3.Connection, nights: Iterable[date]):
+    """Recompute the weekly and monthly averages of the periods containing the nights."""
+    periods = {
+        (resolution, *_period(night, resolution))
+        for night in nights
+        for resolution in ROLLUP_RESOLUTIONS
+    }
+    for resolution, start, end in sorted(periods):
+        conn.execute(
+            "DELETE FROM sleep_rollups WHERE resolution = ? AND period = ?",
+            (resolution, start.isoformat()),
+        )
+        conn.execute(
+            SLEEP_ROLLUP_INSERT_SQL,
+            (resolution, start.isoformat(), start.isoformat(), end.isoformat()),
+        )
+
+
+def _refresh_nights(conn: sqlite3.Connection, rows: Iterable[Tuple[str, float, int]]) -> List[date]:
+    """
+    Recompute the sleep records that newly inserted statistics rows can
+    change, and the rollups of the nights that did. Returns the nights whose
+    record changed.
+    """
+    nights = set()
+    for stat_type, _, ts in rows:
+        day = ts // DAY_MS
+        if stat_type == STAT_WAKEUP:
+            nights.add(day)
+        elif stat_type == STAT_INTERACTION:
+            # Early morning of its own night, or the evening before the next
+            nights.update((day, day + 1))
+    changed = []
+    for day in sorted(nights):
+        night = (EPOCH + day * DAY_MS * _MS).date()
+        stored = conn.execute(
+            "SELECT date, bedtime, wakeup FROM sleep_records WHERE date = ?", (night.isoformat(),)
+        ).fetchall()
+        inferred = _infer_nights(conn, day, day)
+        if inferred != stored:
+            conn.execute("DELETE FROM sleep_records WHERE date = ?", (night.isoformat(),))
+            conn.executemany(SLEEP_RECORD_INSERT_SQL, inferred)
+            changed.append(night)
+    _refresh_rollups(conn, changed)
+    return changed
+
+
+def _sleep_records(conn: sqlite3.Connection):
+    """Materialise the inferred sleep records, one row per night, keyed by date."""
+    conn.execute("""
+        CREATE TABLE sleep_records (
+            date TEXT PRIMARY KEY,
+            bedtime INTEGER NOT NULL,
+            wakeup INTEGER NOT NULL
+        ) WITHOUT ROWID
+    """)
+    (first, last) = conn.execute(
+        "SELECT MIN(timestamp), MAX(timestamp) FROM statistics WHERE type = ?", (STAT_WAKEUP,)
+    ).fetchone()
+    if first is not None:
+        conn.executemany(SLEEP_RECORD_INSERT_SQL, _infer_nights(conn, first // DAY_MS, last // DAY_MS))
+
+
+def _sleep_rollups(conn: sqlite3.Connection):
+    """Weekly and monthly averages of the sleep records, one row per period."""
+    conn.execute("""
+        CREATE TABLE sleep_rollups (
+            resolution TEXT NOT NULL,
+            period TEXT NOT NULL,
+            nights INTEGER NOT NULL,
+            bedtime REAL NOT NULL,
+            wakeup REAL NOT NULL,
+            PRIMARY KEY (resolution, period)
+        ) WITHOUT ROWID
+    """)
+    nights = [date.fromisoformat(night) for (night,) in conn.execute("SELECT date FROM sleep_records")]
+    _refresh_rollups(conn, nights)
+
+
+def _covering_index(conn: sqlite3.Connection):
+    """
+    Replace the (type, timestamp) index with one that also holds the value, so
+    queries by type and time are answered from the index alone. With the
+    old one, every matching row was looked up in the table as well, which
+    made long ranges slower than the unindexed scan they replaced.
+    """
+    conn.execute("DROP INDEX statistics_type_timestamp")
+    conn.execute("CREATE INDEX statistics_type_timestamp_value ON statistics (type, timestamp, value)")
+
+
+# Schema migrations, applied in order. The schema version of a database is
+# its PRAGMA user_version, i.e. the number of migrations applied to it.
+# Only ever append to this list.
+MIGRATIONS: List[Callable[[sqlite3.Connection], None]] = [
+    _create_statistics,
+    _epoch_ms_timestamps,
+    _sleep_records,
+    _sleep_rollups,
+    _covering_index,
+]
 
 class StatisticsDB:
     def __init__(self, db_path: str = "stats.db"):
         self.db_path = db_path
-        self._ensure_table()
+        # One connection per thread (flask + dash), reused across calls
+        self._local = threading.local()
+        # Increases whenever a sleep record changes, so caches of anything
+        # derived from them (the dashboard) know when they are stale
+        self.sleep_version = 0
+        self._version_lock = threading.Lock()
+        # Called with the nights whose record changed, after the change is committed
+        self._listeners: List[Callable[[List[date]], None]] = []
+        self._migrate()
+
+    def _get_conn(self) -> sqlite3.Connection:
+        """This thread's connection, opened and tuned on first use."""
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(
+                self.db_path, timeout=BUSY_TIMEOUT_S, cached_statements=CACHED_STATEMENTS
+            )
+            for pragma in PRAGMAS:
+                conn.execute(pragma)
+            self._local.conn = conn
+        return conn
 
-    def _get_conn(self):
-        # allow usage from multiple threads (flask + dash)
-        return sqlite3.connect(self.db_path, check_same_thread=False)
+    def close(self):
+        """Close this thread's connection. Other threads' close when the thread ends."""
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
 
-    def _ensure_table(self):
+    def _migrate(self):
+        """Bring the schema up to date, one transaction per migration."""
         conn = self._get_conn()
-        c = conn.cursor()
-        c.execute("""
-            CREATE TABLE IF NOT EXISTS statistics (
-                id INTEGER PRIMARY KEY AUTOINCREMENT,
-                type TEXT NOT NULL,
-                value REAL NOT NULL,
-                timestamp DATETIME NOT NULL
-            )
-        """)
-        conn.commit()
-        conn.close()
+        while True:
+            # IMMEDIATE takes the write lock, so concurrent processes migrate one at a time
+            conn.execute("BEGIN IMMEDIATE")
+            try:
+                (version,) = conn.execute("PRAGMA user_version").fetchone()
+                if version >= len(MIGRATIONS):
+                    conn.rollback()
+                    return
+                print(f"Migrating {self.db_path} to schema version {version + 1}")
+                MIGRATIONS[version](conn)
+                conn.execute(f"PRAGMA user_version = {version + 1}")
+                conn.commit()
+            except BaseException:
+                conn.rollback()
+                raise
 
-    def insert(self, stat: Statistics):
-        """
-        Persist a Statistics object into the DB.
-        """
+    @staticmethod
+    def _row(stat: Statistics) -> Tuple[str, float, int]:
+        """The (type, value, timestamp) row stored for a Statistics object."""
         ts = stat.timestamp
         if isinstance(ts, str):
             # try to parse isoformat, fallback to now()
             try:
                 ts = datetime.fromisoformat(ts)
             except ValueError:
-                ts = datetime.utcnow()
+                ts = datetime.now(timezone.utc)
+        return (stat.type, stat.value, to_epoch_ms(ts))
+
+    def insert(self, stat: Statistics):
+        """
+        Persist a Statistics object into the DB.
+        """
+        row = self._row(stat)
         conn = self._get_conn()
-        c = conn.cursor()
-        c.execute(
-            "INSERT INTO statistics (type, value, timestamp) VALUES (?, ?, ?)",
-            (stat.type, stat.value, ts.isoformat())
-        )
-        conn.commit()
-        conn.close()
+        with conn:
+            conn.execute(INSERT_SQL, row)
+            changed = _refresh_nights(conn, [row])
+        self._sleep_records_changed(changed)
+
+    def insert_many(self, stats: List[Statistics]):
+        """
+        Persist several Statistics objects in a single transaction.
+        """
+        rows = [self._row(stat) for stat in stats]
+        conn = self._get_conn()
+        with conn:
+            conn.executemany(INSERT_SQL, rows)
+            changed = _refresh_nights(conn, rows)
+        self._sleep_records_changed(changed)
+
+    def add_listener(self, listener: Callable[[List[date]], None]):
+        """Call listener with the nights whose sleep record changed on each insert."""
+        self._listeners.append(listener)
+
+    def _sleep_records_changed(self, changed: List[date]):
+        """Bump sleep_version and tell the listeners, once changed records are committed."""
+        if not changed:
+            return
+        with self._version_lock:
+            self.sleep_version += 1
+        for listener in self._listeners:
+            try:
+                listener(changed)
+            except Exception as e:
+                # The statistics are stored, don't fail the request over this
+                print(f"Sleep record listener failed: {e}")
 
     def query(
         self,
@@ -55,10 +355,96 @@ class StatisticsDB:
     ) -> List[Statistics]:
         """
         Fetch statistics, optionally filtered by type and/or time window.
+        Timestamps are returned as ISO strings in UTC. Formatting those costs
+        about as much as reading the rows, so prefer query_columns for long
+        ranges.
         """
-        conn = self._get_conn()
-        c = conn.cursor()
+        where, params = self._where(stat_type, start, end)
+        rows = self._get_conn().execute(f"""
+            SELECT type, value, {ISO_TIMESTAMP_SQL}
+              FROM statistics
+            {where}
+            ORDER BY timestamp ASC
+        """, params).fetchall()
+
+        stats: List[Statistics] = []
+        for t, v, ts in rows:
+            stat = Statistics(stat_type=t, value=v, timestamp=ts)
+            stats.append(stat)
+        return stats
+
+    def query_columns(
+        self,
+        stat_type: Optional[str] = None,
+        start: Optional[datetime]   = None,
+        end:   Optional[datetime]   = None
+    ) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Like query, but returns the matching rows as two arrays, int64 epoch
+        milliseconds and float64 values, read straight from the cursor
+        without creating an object per row.
+        """
+        where, params = self._where(stat_type, start, end)
+        cursor = self._get_conn().execute(f"""
+            SELECT timestamp, value
+              FROM statistics
+            {where}
+            ORDER BY timestamp ASC
+        """, params)
+        rows = np.fromiter(cursor, dtype=[("timestamp", np.int64), ("value", np.float64)])
+        return rows["timestamp"], rows["value"]
+
+    def query_sleep_records(self, start: date, end: date) -> List[SleepRecord]:
+        """
+        Sleep records of the nights from start to end (inclusive), as kept up
+        to date on insert. Dates are UTC calendar days of the wakeup, times
+        are UTC.
+        """
+        rows = self._get_conn().execute("""
+            SELECT date, bedtime, wakeup
+              FROM sleep_records
+            WHERE date >= ? AND date <= ?
+            ORDER BY date ASC
+        """, (start.isoformat(), end.isoformat())).fetchall()
+
+        records: List[SleepRecord] = []
+        for day, bedtime, wakeup in rows:
+            bedtime, wakeup = EPOCH + bedtime * _MS, EPOCH + wakeup * _MS
+            records.append(SleepRecord(date=date.fromisoformat(day),
+                                       bedtime=bedtime,
+                                       wakeup=wakeup,
+                                       duration=wakeup - bedtime))
+        return records
+
+    def query_sleep_rollups(self, resolution: str, start: date, end: date) -> List[Tuple[SleepRecord, int]]:
+        """
+        The average night of each week or month (resolution) that starts
+        between start and end, with the number of nights averaged. Records
+        are dated at the first day of their period, times are UTC.
+        """
+        rows = self._get_conn().execute("""
+            SELECT period, nights, bedtime, wakeup
+              FROM sleep_rollups
+            WHERE resolution = ? AND period >= ? AND period <= ?
+            ORDER BY period ASC
+        """, (resolution, start.isoformat(), end.isoformat())).fetchall()
 
+        rollups: List[Tuple[SleepRecord, int]] = []
+        for period, nights, bedtime, wakeup in rows:
+            period = date.fromisoformat(period)
+            midnight = datetime.combine(period, time(), tzinfo=timezone.utc)
+            bedtime, wakeup = midnight + bedtime * _MS, midnight + wakeup * _MS
+            record = SleepRecord(date=period, bedtime=bedtime, wakeup=wakeup, duration=wakeup - bedtime)
+            rollups.append((record, nights))
+        return rollups
+
+    @staticmethod
+    def _where(
+        stat_type: Optional[str],
+        start: Optional[datetime],
+        end: Optional[datetime]
+    ) -> Tuple[str, List]:
+        """WHERE clause and parameters for a type and time window filter."""
         clauses: List[str] = []
         params: List = []
 
@@ -67,24 +453,10 @@ class StatisticsDB:
             params.append(stat_type)
         if start:
             clauses.append("timestamp >= ?")
-            params.append(start.isoformat())
+            params.append(to_epoch_ms(start))
         if end:
             clauses.append("timestamp <= ?")
-            params.append(end.isoformat())
+            params.append(to_epoch_ms(end))
 
         where = ("WHERE " + " AND ".join(clauses)) if clauses else ""
-        c.execute(f"""
-            SELECT type, value, timestamp
-              FROM statistics
-            {where}
-            ORDER BY timestamp ASC
-        """, params)
-
-        rows = c.fetchall()
-        conn.close()
-
-        stats: List[Statistics] = []
-        for t, v, ts in rows:
-            stat = Statistics(stat_type=t, value=v, timestamp=ts)
-            stats.append(stat)
-        return stats
+        return where, params
@@ -0,0 +1,112 @@
+import asyncio
+import json
+import queue
+import threading
+from typing import AsyncIterator, Callable, Dict, Iterator, Tuple, Union
+
+# Events a subscriber can fall behind by before it misses newer ones
+MAX_QUEUED = 100
+# Seconds between keep-alive comments on an idle stream, so proxies and
+# browsers don't take it for dead
+HEARTBEAT_S = 15
+KEEP_ALIVE = ": keep-alive\n\n"
+
+Event = Tuple[str, object]
+Subscription = Union[queue.Queue, asyncio.Queue]
+
+
+def sse_event(event: str, data) -> str:
+    """Format a server-sent event with a JSON payload."""
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+class EventFeed:
+    """
+    Fans events out to any number of subscribers, e.g. server-sent event
+    streams. Publishing never blocks: each subscriber has its own queue, and
+    one that falls MAX_QUEUED events behind misses the newer ones.
+    """
+
+    def __init__(self, max_queued: int = MAX_QUEUED):
+        self.max_queued = max_queued
+        self._subscribers: Dict[Subscription, Callable[[Event], None]] = {}
+        self._lock = threading.Lock()
+        self.dropped = 0
+
+    def publish(self, event: str, data):
+        with self._lock:
+            puts = list(self._subscribers.values())
+        for put in puts:
+            put((event, data))
+
+    def subscribe(self) -> queue.Queue:
+        """A queue of the events published from now on, for a blocking consumer."""
+        q: queue.Queue = queue.Queue(self.max_queued)
+
+        def put(item: Event):
+            try:
+                q.put_nowait(item)
+            except queue.Full:
+                self.dropped += 1
+
+        with self._lock:
+            self._subscribers[q] = put
+        return q
+
+    def asubscribe(self) -> asyncio.Queue:
+        """Like subscribe, but a queue for the running event loop."""
+        q: asyncio.Queue = asyncio.Queue(self.max_queued)
+        loop = asyncio.get_running_loop()
+
+        def put_nowait(item: Event):
+            try:
+                q.put_nowait(item)
+            except asyncio.QueueFull:
+                self.dropped += 1
+
+        with self._lock:
+            # Events are published from other threads (ingestion)
+            self._subscribers[q] = lambda item: loop.call_soon_threadsafe(put_nowait, item)
+        return q
+
+    def unsubscribe(self, q: Subscription):
+        with self._lock:
+            self._subscribers.pop(q, None)
+
+    def stream(self) -> Iterator[str]:
+        """Server-sent events for a blocking (WSGI) response, until the client goes away."""
+        q = self.subscribe()
+        try:
+            # Subscribed, send the headers without waiting for an event
+            yield KEEP_ALIVE
+            while True:
+                try:
+                    event, data = q.get(timeout=HEARTBEAT_S)
+                except queue.Empty:
+                    yield KEEP_ALIVE
+                    continue
+                yield sse_event(event, data)
+        finally:
+            self.unsubscribe(q)
+
+    async def astream(self) -> AsyncIterator[str]:
+        """Server-sent events for an async (ASGI) response, until the client goes away."""
+        q = self.asubscribe()
+        try:
+            # Subscribed, send the headers without waiting for an event
+            yield KEEP_ALIVE
+            while True:
+                try:
+                    event, data = await asyncio.wait_for(q.get(), HEARTBEAT_S)
+                except asyncio.TimeoutError:
+                    yield KEEP_ALIVE
+                    continue
+                yield sse_event(event, data)
+        finally:
+            self.unsubscribe(q)
+
+    def __len__(self):
+        return len(self._subscribers)
+
+    def __repr__(self):
+        return f"EventFeed(subscribers={len(self)}, dropped={self.dropped})"
@@ -0,0 +1,74 @@
+import asyncio
+import concurrent.futures
+import threading
+from typing import Any, Coroutine, Optional
+
+
+class BackgroundLoop:
+    """
+    An asyncio event loop running in its own daemon thread.
+    Lets synchronous code (Flask handlers, worker threads) schedule async LLM
+    work on one shared loop instead of spawning a thread per request.
+    """
+
+    def __init__(self, name: str = "event-loop"):
+        self.loop = asyncio.new_event_loop()
+        self._thread = threading.Thread(target=self._run, name=name, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_forever()
+
+    def submit(self, coro: Coroutine) -> concurrent.futures.Future:
+        """
+        Schedule a coroutine on the loop. Cancelling the returned future also
+        cancels the coroutine, even if it is already running.
+        """
+        return asyncio.run_coroutine_threadsafe(coro, self.loop)
+
+    def run(self, coro: Coroutine, timeout: Optional[float] = None) -> Any:
+        """Run a coroutine on the loop and block until it finishes."""
+        return self.submit(coro).result(timeout)
+
+    async def arun(self, coro: Coroutine) -> Any:
+        """
+        Run a coroutine on the loop and await it from another event loop,
+        e.g. the ASGI server's. Cancelling the caller cancels the coroutine.
+        """
+        return await asyncio.wrap_future(self.submit(coro))
+
+    def stop(self):
+        self.loop.call_soon_threadsafe(self.loop.stop)
+        self._thread.join()
+
+    def __repr__(self):
+        return f"BackgroundLoop(running={self.loop.is_running()})"
+
+
+_shared_loop: Optional[BackgroundLoop] = None
+_shared_lock = threading.Lock()
+
+
+def shared_loop() -> BackgroundLoop:
+    """The process-wide loop used for all async LLM work."""
+    global _shared_loop
+    with _shared_lock:
+        if _shared_loop is None:
+            _shared_loop = BackgroundLoop()
+        return _shared_loop
+
+
+if __name__ == "__main__":
+    import time
+
+    async def work(i: int) -> int:
+        await asyncio.sleep(0.2)
+        return i * i
+
+    loop = shared_loop()
+    start = time.perf_counter()
+    futures = [loop.submit(work(i)) for i in range(100)]
+    futures[0].cancel()
+    results = [f.result() for f in futures[1:]]
+    print(f"Ran {len(results)} coroutines in {time.perf_counter() - start:.2f}s on one loop")
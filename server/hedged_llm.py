@@ -0,0 +1,273 @@
+import asyncio
+import bisect
+import queue
+import threading
+import time
+from typing import Any, Callable, Dict, Iterator, List, Optional
+from llm import LLM
+from event_loop import shared_loop
+
+# Hedge delay used until enough latencies have been recorded to tune it
+DEFAULT_HEDGE_DELAY_S = 8.0
+# Percentile of the primary's latency after which the secondary is started
+DEFAULT_HEDGE_PERCENTILE = 95
+MIN_SAMPLES_FOR_TUNING = 20
+
+
+class InvalidResponse(ValueError):
+    """A response that failed validation, kept so it can still be returned."""
+
+    def __init__(self, raw: str, error: Exception):
+        super().__init__(str(error))
+        self.raw = raw
+
+
+class LatencyHistogram:
+    """Latency histogram with logarithmically spaced buckets from 50 ms to about two minutes."""
+
+    BUCKETS_S = [0.05 * 1.25**i for i in range(36)]
+
+    def __init__(self):
+        self.counts = [0] * (len(self.BUCKETS_S) + 1)
+        self.total = 0
+        self._lock = threading.Lock()
+
+    def record(self, seconds: float):
+        with self._lock:
+            self.counts[bisect.bisect_left(self.BUCKETS_S, seconds)] += 1
+            self.total += 1
+
+    def percentile(self, p: float) -> Optional[float]:
+        """Upper bound of the bucket holding the p-th percentile, or None without samples."""
+        with self._lock:
+            if self.total == 0:
+                return None
+            rank = p / 100 * self.total
+            seen = 0
+            for i, count in enumerate(self.counts):
+                seen += count
+                if seen >= rank and count:
+                    return self.BUCKETS_S[min(i, len(self.BUCKETS_S) - 1)]
+        return self.BUCKETS_S[-1]
+
+    def __repr__(self):
+        p50, p95 = self.percentile(50), self.percentile(95)
+        if p50 is None:
+            return "LatencyHistogram(empty)"
+        return f"LatencyHistogram(n={self.total}, p50={p50:.2f}s, p95={p95:.2f}s)"
+
+
+class HedgedLLM(LLM):
+    """
+    Sends each prompt to a primary backend and, if it has not produced a valid
+    response within the hedge delay, to a secondary backend as well. The first
+    valid response wins and the other request is cancelled.
+
+    With race=True both backends are asked straight away. Without an explicit
+    hedge_delay, the delay is tuned to the primary's latency percentile once
+    enough requests have been measured. A response that fails validation, e.g.
+    one that was cut off, brings in the other backend straight away, but only
+    for as long as it usually takes (see salvage_wait). If no valid response
+    arrives by then, the invalid one is returned for the caller to salvage.
+
+    Streams are hedged on their first chunk instead: the secondary's stream is
+    used if the primary's has produced nothing within the hedge delay.
+    """
+
+    # Concurrency is limited by the wrapped backends
+    max_concurrency = None
+
+    def __init__(
+        self,
+        primary: LLM,
+        secondary: LLM,
+        validate: Optional[Callable[[str], Any]] = None,
+        hedge_delay: Optional[float] = None,
+        hedge_percentile: float = DEFAULT_HEDGE_PERCENTILE,
+        race: bool = False,
+    ):
+        self.primary = primary
+        self.secondary = secondary
+        # Raises if a response is unusable, e.g. Storyteller._beat_from_raw
+        self.validate = validate
+        self.hedge_delay = hedge_delay
+        self.hedge_percentile = hedge_percentile
+        self.race = race
+        self.latencies: Dict[str, LatencyHistogram] = {
+            "primary": LatencyHistogram(),
+            "secondary": LatencyHistogram(),
+        }
+        self.wins = {"primary": 0, "secondary": 0}
+
+    @property
+    def model(self) -> str:
+        """Stable identity of the backends, e.g. for cache keys. Unlike repr, it holds no tuning state."""
+        models = (getattr(llm, "model", None) or type(llm).__name__ for llm in (self.primary, self.secondary))
+        return "hedged:" + "/".join(models)
+
+    def current_hedge_delay(self) -> float:
+        if self.race:
+            return 0.0
+        if self.hedge_delay is not None:
+            return self.hedge_delay
+        histogram = self.latencies["primary"]
+        if histogram.total < MIN_SAMPLES_FOR_TUNING:
+            return DEFAULT_HEDGE_DELAY_S
+        return histogram.percentile(self.hedge_percentile) or DEFAULT_HEDGE_DELAY_S
+
+    def salvage_wait(self) -> float:
+        """
+        Seconds to wait for the secondary once a response has failed
+        validation: its latency percentile once tuned, the hedge delay before.
+        """
+        histogram = self.latencies["secondary"]
+        if histogram.total >= MIN_SAMPLES_FOR_TUNING:
+            return histogram.percentile(self.hedge_percentile) or DEFAULT_HEDGE_DELAY_S
+        return self.hedge_delay or DEFAULT_HEDGE_DELAY_S
+
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        return shared_loop().run(self.agenerate(system_prompt, user_prompt))
+
+    async def _timed(self, name: str, llm: LLM, system_prompt: str, user_prompt: str) -> str:
+        start = time.perf_counter()
+        raw = await llm.agenerate(system_prompt, user_prompt)
+        self.latencies[name].record(time.perf_counter() - start)
+        if self.validate:
+            try:
+                self.validate(raw)
+            except Exception as e:
+                raise InvalidResponse(raw, e)
+        return raw
+
+    async def _agenerate(self, system_prompt: str, user_prompt: str) -> str:
+        backends = {"primary": self.primary, "secondary": self.secondary}
+        tasks: Dict[asyncio.Task, str] = {}
+        started = time.perf_counter()
+
+        def launch(name: str):
+            task = asyncio.create_task(self._timed(name, backends[name], system_prompt, user_prompt))
+            tasks[task] = name
+
+        launch("primary")
+        pending = set(tasks)
+        timeout: Optional[float] = self.current_hedge_delay()
+        errors: List[BaseException] = []
+        invalid: Optional[InvalidResponse] = None
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED
+                )
+                for task in done:
+                    if task.exception() is None:
+                        name = tasks[task]
+                        self.wins[name] += 1
+                        if name == "secondary":
+                            self._record_cancelled_primary(tasks, started)
+                        return task.result()
+                    errors.append(task.exception())  # type: ignore
+                    if isinstance(errors[-1], InvalidResponse):
+                        # Something to salvage: only wait a usual response time for better
+                        invalid = errors[-1]
+                        timeout = self.salvage_wait()
+                if invalid and not done:
+                    break
+                # Primary was slow or failed: bring in the secondary
+                if len(tasks) == 1:
+                    launch("secondary")
+                    pending = {t for t in tasks if not t.done()}
+                    if not invalid:
+                        timeout = None
+            if invalid:
+                return invalid.raw
+            raise errors[-1]
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    @staticmethod
+    def _pump(name: str, llm: LLM, system_prompt: str, user_prompt: str, out: queue.Queue, stop: threading.Event):
+        """
+        Put the chunks of a stream on out as (name, chunk, None), then
+        (name, None, None) at the end or (name, None, exception) if it fails.
+        Runs in its own thread; the stream is closed once stop is set.
+        """
+        try:
+            chunks = llm.stream(system_prompt, user_prompt)
+            try:
+                for chunk in chunks:
+                    if stop.is_set():
+                        return
+                    out.put((name, chunk, None))
+            finally:
+                chunks.close()  # type: ignore
+            out.put((name, None, None))
+        except Exception as e:
+            out.put((name, None, e))
+
+    def stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        backends = {"primary": self.primary, "secondary": self.secondary}
+        out: queue.Queue = queue.Queue()
+        stops: Dict[str, threading.Event] = {}
+
+        def launch(name: str):
+            stops[name] = threading.Event()
+            threading.Thread(
+                target=self._pump,
+                args=(name, backends[name], system_prompt, user_prompt, out, stops[name]),
+                daemon=True,
+            ).start()
+
+        launch("primary")
+        timeout: Optional[float] = self.current_hedge_delay()
+        errors: List[BaseException] = []
+        try:
+            # Wait for the first chunk, bringing in the secondary if the primary is slow or fails
+            while True:
+                try:
+                    name, chunk, error = out.get(timeout=timeout)
+                except queue.Empty:
+                    launch("secondary")
+                    timeout = None
+                    continue
+                if chunk is not None:
+                    break
+                errors.append(error or ValueError(f"Empty response from {backends[name]}"))
+                if len(stops) == 1:
+                    launch("secondary")
+                    timeout = None
+                elif len(errors) == len(stops):
+                    raise errors[-1]
+
+            winner = name
+            self.wins[winner] += 1
+            for other, stop in stops.items():
+                if other != winner:
+                    stop.set()
+            yield chunk
+            while True:
+                name, chunk, error = out.get()
+                if name != winner:
+                    continue
+                if error:
+                    raise error
+                if chunk is None:
+                    return
+                yield chunk
+        finally:
+            for stop in stops.values():
+                stop.set()
+
+    def _record_cancelled_primary(self, tasks: Dict[asyncio.Task, str], started: float):
+        """
+        Record a primary about to be cancelled because the secondary won at
+        its elapsed time. That is only a lower bound on its latency, but
+        leaving these slow requests out would pull the percentile, and so the
+        hedge delay, down further with every hedge.
+        """
+        if any(name == "primary" and not task.done() for task, name in tasks.items()):
+            self.latencies["primary"].record(time.perf_counter() - started)
+
+    def __repr__(self):
+        mode = "race" if self.race else f"hedge after {self.current_hedge_delay():.2f}s"
+        return f"Hedged ({self.primary} / {self.secondary}, {mode})"
@@ -1,6 +1,6 @@
 import os
 import random
-from storyteller import Storyteller
+from storyteller import Storyteller, Story
 from models import (
     MODES_SYMBOLS,
     MODE_ADVANTAGE,
@@ -15,7 +15,8 @@ def main():
         print("API_KEY is not set.")
         return
     storyteller = Storyteller(api_key=api_key)
-    beat = storyteller.generate_new_story()
+    story = Story()
+    beat = storyteller.generate_new_story(story)
     while True:
         print("\n" + beat.beat_text)
 
@@ -56,7 +57,7 @@ def main():
             result = "Solid Success."
         else:
             result = "Failure."
-        beat = storyteller.continue_story(choice_id=choice_id, success_result=result)
+        beat = storyteller.continue_story(story, choice_id=choice_id, success_result=result)
 
         # Check if the story ended (no choices and not an explicit ending)
         if beat.is_ending:
@@ -1,22 +1,39 @@
 from abc import ABC, abstractmethod
-from openai import OpenAI
+from typing import Iterator, List, Optional, Sequence, Tuple, Union
+import asyncio
+import json
 from prompts import STORYTELLER_SYSTEM_PROMPT
-import anthropic
-import ftfy
 import re
 
+# The provider SDKs and ftfy are imported on first use, not at start up:
+# together they take most of a second to import.
+
 def clean_with_ftfy(s: str) -> str:
     """
     Cleans the input string using ftfy to fix common text encoding issues,
     and then encodes it to ASCII, ignoring non-ASCII characters.
     """
+    import ftfy
+
     fixed = ftfy.fix_text(s)
     fixed = ftfy.fix_text(s)
     cleaned = re.sub(r'[^\x20-\x7E]', ' ', fixed)
     return cleaned
 
 
+# Default number of requests a backend may have in flight at once
+DEFAULT_MAX_CONCURRENCY = 8
+
+
 class LLM(ABC):
+    # None for wrappers around other LLMs: only the backends they wrap limit
+    # concurrency, or stacked wrappers would each cap the whole server
+    max_concurrency: Optional[int] = DEFAULT_MAX_CONCURRENCY
+    _async_semaphore: Optional[asyncio.Semaphore] = None
+    # Token usage of the latest call and totals, for backends that report it
+    last_usage: Optional[dict] = None
+    total_usage: Optional[dict] = None
+
     @abstractmethod
     def generate(self, system_prompt: str, user_prompt: str) -> str:
         """
@@ -24,28 +41,153 @@ class LLM(ABC):
         """
         pass
 
+    def stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        """
+        Like generate, but yields the output in chunks as the backend produces it.
+        Backends without streaming support yield the whole output at once.
+        """
+        yield self.generate(system_prompt, user_prompt)
+
+    async def agenerate(self, system_prompt: str, user_prompt: str) -> str:
+        """
+        Async version of generate. At most max_concurrency calls run at once,
+        the rest wait their turn. Cancelling the calling task cancels the request.
+        """
+        if self.max_concurrency is None:
+            return await self._agenerate(system_prompt, user_prompt)
+        if self._async_semaphore is None:
+            self._async_semaphore = asyncio.Semaphore(self.max_concurrency)
+        async with self._async_semaphore:
+            return await self._agenerate(system_prompt, user_prompt)
+
+    async def _agenerate(self, system_prompt: str, user_prompt: str) -> str:
+        """Backend specific async request. Defaults to running generate in a worker thread."""
+        return await asyncio.to_thread(self.generate, system_prompt, user_prompt)
+
+    def _record_usage(self, uncached: int, cache_read: int = 0, cache_write: int = 0, output: int = 0):
+        """Record input tokens split by prompt cache status, and output tokens, for one call."""
+        self.last_usage = {
+            "uncached_input_tokens": uncached,
+            "cache_read_input_tokens": cache_read,
+            "cache_write_input_tokens": cache_write,
+            "output_tokens": output,
+        }
+        if self.total_usage is None:
+            self.total_usage = dict.fromkeys(self.last_usage, 0)
+        for key, value in self.last_usage.items():
+            self.total_usage[key] += value
+        print(f"{self} usage: {uncached} uncached, {cache_read} cached, {cache_write} cache write, {output} output tokens")
+
+    async def agenerate_many(
+        self, prompts: Sequence[Tuple[str, str]]
+    ) -> List[Union[str, BaseException]]:
+        """
+        Run several (system_prompt, user_prompt) requests concurrently.
+        Results are returned in order; a failed request yields its exception
+        instead of failing the whole batch.
+        """
+        return await asyncio.gather(
+            *(self.agenerate(system_prompt, user_prompt) for system_prompt, user_prompt in prompts),
+            return_exceptions=True,
+        )
+
 
 class OpenAILLM(LLM):
-    def __init__(self, api_key: str, model: str = "gpt-4o"):
-        self.client = OpenAI(api_key=api_key)
+    def __init__(
+        self,
+        api_key: str,
+        model: str = "gpt-4o",
+        schema: Optional[dict] = None,
+        schema_name: str = "response",
+    ):
+        self.api_key = api_key
+        self._client = None
+        self._async_client = None
         self.model = model
+        # With a schema, responses are constrained to JSON matching it
+        self.schema = schema
+        self.extra_args: dict = {}
+        if schema:
+            self.extra_args["response_format"] = {
+                "type": "json_schema",
+                "json_schema": {"name": schema_name, "schema": schema, "strict": True},
+            }
 
-    def generate(self, system_prompt: str, user_prompt: str) -> str:
-        response = self.client.chat.completions.create(
-            model=self.model,
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": user_prompt},
-            ],
-            #response_format={"type": "json_object"},
-        )
+    @property
+    def client(self):
+        if self._client is None:
+            from openai import OpenAI
+
+            self._client = OpenAI(api_key=self.api_key)
+        return self._client
+
+    @property
+    def async_client(self):
+        # Created once so its connection pool is reused across requests
+        if self._async_client is None:
+            from openai import AsyncOpenAI
+
+            self._async_client = AsyncOpenAI(api_key=self.api_key)
+        return self._async_client
+
+    @staticmethod
+    def _messages(system_prompt: str, user_prompt: str) -> list:
+        return [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": user_prompt},
+        ]
+
+    def _content(self, response) -> str:
+        # OpenAI caches long prompt prefixes automatically; the static system
+        # prompt comes first so every request shares the same prefix.
+        usage = getattr(response, "usage", None)
+        if usage:
+            details = getattr(usage, "prompt_tokens_details", None)
+            cached = (getattr(details, "cached_tokens", 0) or 0) if details else 0
+            self._record_usage(usage.prompt_tokens - cached, cache_read=cached, output=usage.completion_tokens)
         content = response.choices[0].message.content
         if content is None:
             raise ValueError("No content from OpenAI")
         return clean_with_ftfy(content)
+
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, user_prompt),
+            **self.extra_args,
+        )
+        return self._content(response)
+
+    async def _agenerate(self, system_prompt: str, user_prompt: str) -> str:
+        response = await self.async_client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, user_prompt),
+            **self.extra_args,
+        )
+        return self._content(response)
+
+    def stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        response = self.client.chat.completions.create(
+            model=self.model,
+            messages=self._messages(system_prompt, user_prompt),
+            stream=True,
+            stream_options={"include_usage": True},
+            **self.extra_args,
+        )
+        for chunk in response:
+            if chunk.usage:
+                details = chunk.usage.prompt_tokens_details
+                cached = (details.cached_tokens or 0) if details else 0
+                self._record_usage(chunk.usage.prompt_tokens - cached, cache_read=cached, output=chunk.usage.completion_tokens)
+            if chunk.choices and chunk.choices[0].delta.content:
+                yield clean_with_ftfy(chunk.choices[0].delta.content)
     
     def __repr__(self):
-        return f"OpenAI ({self.model})"
+        return f"OpenAI ({self.model}{', structured' if self.schema else ''})"
+
+
+# Anthropic prompt caching marker; cached prefixes live for about five minutes
+CACHE_CONTROL = {"type": "ephemeral"}
 
 
 class ClaudeLLM(LLM):
@@ -54,31 +196,120 @@ class ClaudeLLM(LLM):
         api_key: str,
         model: str = "claude-sonnet-4-20250514",
         max_tokens: int = 1500,
+        schema: Optional[dict] = None,
+        schema_name: str = "response",
     ):
-        self.client = anthropic.Anthropic(api_key=api_key)
+        self.api_key = api_key
+        self._client = None
+        self._async_client = None
         self.model = model
         self.max_tokens = max_tokens
+        # With a schema, Claude is forced to answer through a tool taking
+        # input that matches it, and the tool input is returned as JSON text
+        self.schema = schema
+        self.extra_args: dict = {}
+        if schema:
+            self.extra_args["tools"] = [{
+                "name": schema_name,
+                "description": "Submit the response. Always call this tool.",
+                "input_schema": schema,
+            }]
+            self.extra_args["tool_choice"] = {"type": "tool", "name": schema_name}
 
-    def generate(self, system_prompt: str, user_prompt: str) -> str:
-        response = self.client.messages.create(
+    @property
+    def client(self):
+        if self._client is None:
+            import anthropic
+
+            self._client = anthropic.Anthropic(api_key=self.api_key)
+        return self._client
+
+    @property
+    def async_client(self):
+        # Created once so its connection pool is reused across requests
+        if self._async_client is None:
+            import anthropic
+
+            self._async_client = anthropic.AsyncAnthropic(api_key=self.api_key)
+        return self._async_client
+
+    @staticmethod
+    def _system(system_prompt: str) -> list:
+        """The system prompt is static, so it is always marked for prompt caching."""
+        return [{"type": "text", "text": system_prompt, "cache_control": CACHE_CONTROL}]
+
+    @staticmethod
+    def _messages(user_prompt: str) -> list:
+        """
+        Split a SegmentedPrompt into one content block per segment and mark the
+        second to last one, the end of the story history, for prompt caching.
+        The next turn only appends segments, so its prefix up to this block
+        boundary is read from the cache.
+        """
+        segments = getattr(user_prompt, "segments", None)
+        if not segments or len(segments) < 2:
+            return [{"role": "user", "content": user_prompt}]
+        blocks: list = [{"type": "text", "text": segment} for segment in segments]
+        blocks[-2]["cache_control"] = CACHE_CONTROL
+        return [{"role": "user", "content": blocks}]
+
+    def _request(self, system_prompt: str, user_prompt: str) -> dict:
+        return dict(
             model=self.model,
             max_tokens=self.max_tokens,
-            system=system_prompt,
-            messages=[{"role": "user", "content": user_prompt}],
+            system=self._system(system_prompt),
+            messages=self._messages(user_prompt),
+            **self.extra_args,
         )
 
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        response = self.client.messages.create(**self._request(system_prompt, user_prompt))
+        return self._content(response)
+
+    async def _agenerate(self, system_prompt: str, user_prompt: str) -> str:
+        response = await self.async_client.messages.create(**self._request(system_prompt, user_prompt))
+        return self._content(response)
+
+    def _record_response_usage(self, usage):
+        self._record_usage(
+            usage.input_tokens,
+            cache_read=getattr(usage, "cache_read_input_tokens", 0) or 0,
+            cache_write=getattr(usage, "cache_creation_input_tokens", 0) or 0,
+            output=usage.output_tokens,
+        )
+
+    def _content(self, response) -> str:
+        self._record_response_usage(response.usage)
         if not response.content or len(response.content) == 0:
             raise ValueError("No content from Claude")
 
+        if self.schema:
+            tool_use = next((block for block in response.content if block.type == "tool_use"), None)
+            if tool_use is None:
+                raise ValueError("No tool use in structured response from Claude")
+            return clean_with_ftfy(json.dumps(tool_use.input, ensure_ascii=False))
+
         # Claude returns a list of content blocks, get the text from the first one
         content_block = response.content[0]
         if hasattr(content_block, "text"):
             return clean_with_ftfy(content_block.text)  # type: ignore
         else:
             raise ValueError("Unexpected content format from Claude")
+
+    def stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        with self.client.messages.stream(**self._request(system_prompt, user_prompt)) as stream:
+            if self.schema:
+                # Tool input arrives as partial JSON rather than text
+                for event in stream:
+                    if event.type == "content_block_delta" and event.delta.type == "input_json_delta":
+                        yield clean_with_ftfy(event.delta.partial_json)
+            else:
+                for text in stream.text_stream:
+                    yield clean_with_ftfy(text)
+            self._record_response_usage(stream.get_final_message().usage)
         
     def __repr__(self):
-        return f"Anthropic ({self.model})"
+        return f"Anthropic ({self.model}{', structured' if self.schema else ''})"
 
 
 if __name__ == "__main__":
@@ -0,0 +1,265 @@
+import asyncio
+import hashlib
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Iterator, Optional
+from llm import LLM
+
+DEFAULT_MEMORY_ENTRIES = 256
+DEFAULT_DISK_BYTES = 100 * 1024 * 1024
+DEFAULT_TTL_S = 30 * 24 * 60 * 60
+# Seconds between scans for expired disk entries
+EXPIRY_INTERVAL_S = 60
+
+
+def cache_key(model: str, system_prompt: str, user_prompt: str) -> str:
+    """Content address of a request."""
+    h = hashlib.sha256()
+    for part in (model, system_prompt, user_prompt):
+        h.update(part.encode("utf-8"))
+        h.update(b"\0")
+    return h.hexdigest()
+
+
+class ResponseCache:
+    """
+    Two-tier cache of LLM responses: an in-memory LRU in front of an SQLite
+    table. Disk entries expire after ttl_s and the least recently used are
+    evicted once the table holds more than max_bytes of responses.
+    The async methods check the memory tier on the event loop and do disk
+    access in a worker thread.
+    """
+
+    def __init__(
+        self,
+        db_path: Optional[str] = "llm_cache.db",
+        max_entries: int = DEFAULT_MEMORY_ENTRIES,
+        max_bytes: int = DEFAULT_DISK_BYTES,
+        ttl_s: float = DEFAULT_TTL_S,
+    ):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.ttl_s = ttl_s
+        self._memory: "OrderedDict[str, str]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.memory_hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        # One connection shared by all threads, used under _db_lock
+        self._conn: Optional[sqlite3.Connection] = None
+        self._db_lock = threading.Lock()
+        # Bytes of responses on disk, kept up to date instead of summed on every put
+        self._disk_bytes = 0
+        self._last_expiry = 0.0
+        if self.db_path:
+            self._open()
+
+    def _open(self):
+        self._conn = sqlite3.connect(self.db_path, check_same_thread=False)
+        self._conn.execute("""
+            CREATE TABLE IF NOT EXISTS llm_cache (
+                key TEXT PRIMARY KEY,
+                response TEXT NOT NULL,
+                size INTEGER NOT NULL,
+                created REAL NOT NULL,
+                last_used REAL NOT NULL
+            )
+        """)
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_last_used ON llm_cache (last_used)")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS llm_cache_created ON llm_cache (created)")
+        (self._disk_bytes,) = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM llm_cache").fetchone()
+        self._conn.commit()
+
+    def _memory_get(self, key: str) -> Optional[str]:
+        with self._lock:
+            if key in self._memory:
+                self._memory.move_to_end(key)
+                self.memory_hits += 1
+                return self._memory[key]
+        return None
+
+    def _disk_hit(self, key: str, response: Optional[str]) -> Optional[str]:
+        with self._lock:
+            if response is None:
+                self.misses += 1
+                return None
+            self.disk_hits += 1
+            self._remember(key, response)
+        return response
+
+    def get(self, key: str) -> Optional[str]:
+        response = self._memory_get(key)
+        if response is not None:
+            return response
+        return self._disk_hit(key, self._disk_get(key) if self.db_path else None)
+
+    async def aget(self, key: str) -> Optional[str]:
+        """Async version of get, reads the disk tier in a worker thread."""
+        response = self._memory_get(key)
+        if response is not None:
+            return response
+        disk = await asyncio.to_thread(self._disk_get, key) if self.db_path else None
+        return self._disk_hit(key, disk)
+
+    def put(self, key: str, response: str):
+        with self._lock:
+            self._remember(key, response)
+        if self.db_path:
+            self._disk_put(key, response)
+
+    async def aput(self, key: str, response: str):
+        """Async version of put, writes the disk tier in a worker thread."""
+        with self._lock:
+            self._remember(key, response)
+        if self.db_path:
+            await asyncio.to_thread(self._disk_put, key, response)
+
+    def _remember(self, key: str, response: str):
+        """Add to the memory tier. Caller holds the lock."""
+        self._memory[key] = response
+        self._memory.move_to_end(key)
+        while len(self._memory) > self.max_entries:
+            self._memory.popitem(last=False)
+
+    def _disk_get(self, key: str) -> Optional[str]:
+        now = time.time()
+        with self._db_lock:
+            row = self._conn.execute(
+                "SELECT response FROM llm_cache WHERE key = ? AND created >= ?",
+                (key, now - self.ttl_s),
+            ).fetchone()
+            if row:
+                self._conn.execute("UPDATE llm_cache SET last_used = ? WHERE key = ?", (now, key))
+                self._conn.commit()
+        return row[0] if row else None
+
+    def _disk_put(self, key: str, response: str):
+        now = time.time()
+        size = len(response.encode("utf-8"))
+        with self._db_lock:
+            old = self._conn.execute("SELECT size FROM llm_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute(
+                "INSERT OR REPLACE INTO llm_cache (key, response, size, created, last_used) VALUES (?, ?, ?, ?, ?)",
+                (key, response, size, now, now),
+            )
+            self._disk_bytes += size - (old[0] if old else 0)
+            self._evict(now)
+            self._conn.commit()
+
+    def _evict(self, now: float):
+        """Drop expired entries, at most once a minute, then the least recently used past max_bytes. Caller holds _db_lock."""
+        if now - self._last_expiry >= EXPIRY_INTERVAL_S:
+            self._last_expiry = now
+            cutoff = now - self.ttl_s
+            (expired,) = self._conn.execute(
+                "SELECT COALESCE(SUM(size), 0) FROM llm_cache WHERE created < ?", (cutoff,)
+            ).fetchone()
+            if expired:
+                self._conn.execute("DELETE FROM llm_cache WHERE created < ?", (cutoff,))
+                self._disk_bytes -= expired
+        if self._disk_bytes <= self.max_bytes:
+            return
+        # Drop least recently used entries until back under the limit
+        excess = self._disk_bytes - self.max_bytes
+        freed = 0
+        stale = []
+        for key, size in self._conn.execute("SELECT key, size FROM llm_cache ORDER BY last_used ASC"):
+            if freed >= excess:
+                break
+            stale.append((key,))
+            freed += size
+        self._conn.executemany("DELETE FROM llm_cache WHERE key = ?", stale)
+        self._disk_bytes -= freed
+
+    def stats(self) -> dict:
+        lookups = self.memory_hits + self.disk_hits + self.misses
+        return {
+            "memory_hits": self.memory_hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.memory_hits + self.disk_hits) / lookups if lookups else 0.0,
+            "disk_bytes": self._disk_bytes,
+        }
+
+    def __repr__(self):
+        return f"ResponseCache({self.stats()})"
+
+
+class CachedLLM(LLM):
+    """
+    Wraps any LLM and answers repeated (model, system prompt, user prompt)
+    requests from a ResponseCache. Only responses that pass validate are
+    stored, so a malformed response is never replayed to a retry.
+    """
+
+    # Concurrency is limited by the wrapped backends
+    max_concurrency = None
+
+    def __init__(
+        self,
+        llm: LLM,
+        cache: Optional[ResponseCache] = None,
+        validate: Optional[Callable[[str], Any]] = None,
+    ):
+        self.llm = llm
+        self.cache = cache or ResponseCache()
+        # Raises if a response is unusable, e.g. Storyteller._beat_from_raw
+        self.validate = validate
+
+    def _key(self, system_prompt: str, user_prompt: str) -> str:
+        # Never repr: wrappers may show runtime state, e.g. HedgedLLM's tuned delay
+        model = getattr(self.llm, "model", None) or type(self.llm).__name__
+        return cache_key(model, system_prompt, user_prompt)
+
+    def _valid(self, response: str) -> bool:
+        if self.validate:
+            try:
+                self.validate(response)
+            except Exception:
+                return False
+        return True
+
+    def _store(self, key: str, response: str):
+        if self._valid(response):
+            self.cache.put(key, response)
+
+    def generate(self, system_prompt: str, user_prompt: str) -> str:
+        key = self._key(system_prompt, user_prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            return cached
+        response = self.llm.generate(system_prompt, user_prompt)
+        self._store(key, response)
+        return response
+
+    async def agenerate(self, system_prompt: str, user_prompt: str) -> str:
+        """
+        Overrides LLM.agenerate so a hit never waits for a concurrency slot:
+        only the wrapped LLM limits concurrency, and only misses reach it.
+        """
+        key = self._key(system_prompt, user_prompt)
+        cached = await self.cache.aget(key)
+        if cached is not None:
+            return cached
+        response = await self.llm.agenerate(system_prompt, user_prompt)
+        if self._valid(response):
+            await self.cache.aput(key, response)
+        return response
+
+    def stream(self, system_prompt: str, user_prompt: str) -> Iterator[str]:
+        key = self._key(system_prompt, user_prompt)
+        cached = self.cache.get(key)
+        if cached is not None:
+            yield cached
+            return
+        chunks = []
+        for chunk in self.llm.stream(system_prompt, user_prompt):
+            chunks.append(chunk)
+            yield chunk
+        self._store(key, "".join(chunks))
+
+    def __repr__(self):
+        return f"Cached ({self.llm})"
@@ -9,6 +9,11 @@ MODES_STRINGS = {
 }
 MODES_SYMBOLS = {MODE_DISADVANTAGE: "-", MODE_NORMAL: "", MODE_ADVANTAGE: "+"}
 
+# Outcomes of a roll as reported by the device, from worst to best
+SUCCESS_LEVELS = ["Disaster", "Failure", "Close Call", "Solid Success", "Triumph"]
+# Outcome reported for choices without a skill check (difficulty 0)
+PASSIVE_RESULT = "Passive choice selected."
+
 
 class Choice:
     """Represents a choice in the story with its difficulty and advantage mode"""
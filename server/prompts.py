@@ -72,6 +72,19 @@ STORYTELLER_SYSTEM_PROMPT = (
 )
 
 
+class SegmentedPrompt(str):
+    """
+    A prompt that remembers the segments it was joined from. It behaves like
+    the joined string everywhere, but backends with prompt caching can place
+    cache breakpoints between segments, e.g. after each turn of the story history.
+    """
+
+    def __new__(cls, segments: list[str]):
+        prompt = super().__new__(cls, "".join(segments))
+        prompt.segments = [segment for segment in segments if segment]
+        return prompt
+
+
 def get_new_story_prompt(themes: list[str]) -> str:
     """
     Generate a prompt for creating a new story with the given themes.
@@ -99,4 +112,87 @@ def get_new_story_prompt(themes: list[str]) -> str:
         "• Which questions to ask for more information\n"
         "• Which direction to explore first\n"
         "• How to emotionally react to the situation"
-    )
\ No newline at end of file
+    )
+
+SUMMARY_SYSTEM_PROMPT = (
+    "You condense the history of an ongoing Choose-Your-Own-Adventure story into a compact "
+    "'story so far' record for the storyteller who continues it. "
+    "Keep everything that can matter later: the protagonist's goal, injuries, items and relationships, "
+    "NPCs and their attitudes, open threats and mysteries, and the consequences of past choices. "
+    "Drop prose, atmosphere and anything already resolved. "
+    "Reply with plain text only, at most 200 words."
+)
+
+
+def get_summary_prompt(previous_summary: str, history: str) -> str:
+    """
+    Generate a prompt asking for an updated story summary, folding the newly
+    condensed turns into the previous summary.
+    """
+    previous = previous_summary or "(nothing yet, this is the start of the story)"
+    return (
+        f"Story so far:\n{previous}\n\n"
+        f"Events since then:\n{history}\n"
+        "Write the updated story so far."
+    )
+
+
+
+def get_completion_prompt(partial: str, missing: list[str], cut_off: str | None) -> str:
+    """
+    Generate a prompt asking only for the fields missing from a story beat
+    whose response was cut off, instead of regenerating the whole beat.
+    It is appended to the prompt of the cut-off request.
+    """
+    wanted = []
+    if cut_off:
+        wanted.append(f"the rest of the {cut_off} list, continuing after the items above")
+    wanted += [field for field in missing if field != cut_off]
+    return (
+        "\n\nYour previous reply was cut off. This is the part that arrived:\n"
+        f"{partial}\n\n"
+        f"Provide only {', '.join(wanted)}. "
+        "Reply in the same JSON format, with the beat left as an empty string. "
+        "All other fields are kept from the reply above."
+    )
+
+# JSON schema of a story beat, for backends with structured output (tool use
+# or json_schema response formats). Mirrors the format described in
+# STORYTELLER_SYSTEM_PROMPT, but with choices as objects instead of strings.
+STORY_BEAT_SCHEMA_NAME = "story_beat"
+STORY_BEAT_SCHEMA = {
+    "type": "object",
+    "properties": {
+        "beat": {
+            "type": "string",
+            "description": "1-2 compelling paragraphs that advance the story",
+        },
+        "choices": {
+            "type": "array",
+            "description": "2-5 meaningful options",
+            "items": {
+                "type": "object",
+                "properties": {
+                    "index": {"type": "integer", "description": "Number 1-5"},
+                    "text": {"type": "string", "description": "Specific, actionable choice text"},
+                    "difficulty": {
+                        "type": "integer",
+                        "description": "0 for passive choices without a check, otherwise 2-8",
+                    },
+                    "roll_mode": {
+                        "type": "integer",
+                        "enum": [-1, 0, 1],
+                        "description": "-1 disadvantage, 0 normal, 1 advantage",
+                    },
+                },
+                "required": ["index", "text", "difficulty", "roll_mode"],
+                "additionalProperties": False,
+            },
+        },
+        "npcs": {"type": "array", "items": {"type": "string"}},
+        "atmosphere": {"type": "string"},
+        "endstory": {"type": "boolean"},
+    },
+    "required": ["beat", "choices", "npcs", "atmosphere", "endstory"],
+    "additionalProperties": False,
+}
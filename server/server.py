@@ -1,36 +1,108 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, request, jsonify, stream_with_context
 import os
-from storyteller import Storyteller
+import threading
+from storyteller import Storyteller, STREAM_BEAT
+from sessions import SessionStore
+from beat_pool import BeatPool
+from speculation import Speculator
+from event_loop import shared_loop
+from event_feed import sse_event
 from stats import Statistics
 from datetime import datetime
 from db import StatisticsDB
-from dashboard import DashboardApp
 from llm import OpenAILLM, ClaudeLLM
+from hedged_llm import HedgedLLM
+from llm_cache import CachedLLM, ResponseCache
 from utils import get_api_keys
+from prompts import STORY_BEAT_SCHEMA, STORY_BEAT_SCHEMA_NAME
 
 app = Flask(__name__)
 
 # Get API keys from environment variables
 api_keys = get_api_keys()
+# Constrain beats to STORY_BEAT_SCHEMA (tool use / json_schema) instead of
+# parsing free text, which makes malformed responses and retries very rare
+STRUCTURED_OUTPUT = True
+structured = dict(schema=STORY_BEAT_SCHEMA, schema_name=STORY_BEAT_SCHEMA_NAME) if STRUCTURED_OUTPUT else {}
 #llm = OpenAILLM(api_key=openai_api_key, model="gpt-4o-mini")
-llm = ClaudeLLM(api_key=api_keys.get("anthropic"), model="claude-sonnet-4-20250514")
-storyteller = Storyteller(llm)
+claude = ClaudeLLM(api_key=api_keys.get("anthropic"), model="claude-sonnet-4-20250514", **structured)
+llm = claude
+# Summaries are plain text, so they get their own unconstrained backend
+summary_llm = ClaudeLLM(api_key=api_keys.get("anthropic"), model="claude-sonnet-4-20250514")
+# Fall back to OpenAI when Claude is slower than usual, see HedgedLLM
+HEDGE_LLM = True
+if HEDGE_LLM:
+    llm = HedgedLLM(
+        primary=claude,
+        secondary=OpenAILLM(api_key=api_keys.get("openai"), model="gpt-4o-mini", **structured),
+        validate=Storyteller._beat_from_raw,
+    )
+# Answer repeated prompts (replayed sessions, benchmarks) from llm_cache.db
+CACHE_LLM = True
+if CACHE_LLM:
+    llm = CachedLLM(llm, ResponseCache("llm_cache.db"), validate=Storyteller._beat_from_raw)
+storyteller = Storyteller(llm, summary_llm=summary_llm)
+# Live stories, one per device, keyed by the session id returned from /new
+sessions = SessionStore()
+# Opening beats generated ahead of time so /new doesn't wait on the LLM
+opening_pool = BeatPool(
+    lambda: shared_loop().run(storyteller.agenerate_opening_beat()),
+    path="opening_pool.json",
+)
+# Likely next beats generated while the player reads and rolls.
+# Each branch costs one LLM call, so keep the budget modest.
+SPECULATIVE_BRANCHES = 8
+SPECULATIVE_WORKERS = 4
+speculator = Speculator(
+    storyteller.agenerate_continuation,
+    max_branches=SPECULATIVE_BRANCHES,
+    max_workers=SPECULATIVE_WORKERS,
+)
 
 # Initialize SQLite DB
 db = StatisticsDB("stats.db")
 
-# Mount the Dash dashboard
-dashboard = DashboardApp(server=app, db=db, url_base_pathname='/dashboard/')
+# The Dash dashboard is built on its first request: importing Dash and Plotly
+# and building the layout is most of the start up time otherwise
+DASHBOARD_PATH = '/dashboard/'
+_dashboard = None
+_dashboard_lock = threading.Lock()
+
+
+def get_dashboard():
+    """The DashboardApp, built on first use."""
+    global _dashboard
+    with _dashboard_lock:
+        if _dashboard is None:
+            from dashboard import DashboardApp
+
+            _dashboard = DashboardApp(server=Flask('dashboard'), db=db, url_base_pathname=DASHBOARD_PATH)
+        return _dashboard
+
+
+def mount_dashboard(wsgi_app):
+    """WSGI middleware sending requests under DASHBOARD_PATH to the dashboard's own Flask app."""
+    def dispatch(environ, start_response):
+        if (environ.get('PATH_INFO', '') + '/').startswith(DASHBOARD_PATH):
+            return get_dashboard().app.server(environ, start_response)
+        return wsgi_app(environ, start_response)
+    return dispatch
+
+
+app.wsgi_app = mount_dashboard(app.wsgi_app)
 
 
 @app.route('/new', methods=['GET'])
 def get_new_story():
     """GET endpoint to start a new story"""
     try:
-        story_beat = storyteller.generate_new_story()
-        print(f"New story beat generated: {story_beat.to_dict()}")
+        session_id, story = sessions.create()
+        story_beat = storyteller.generate_new_story(story, pool=opening_pool)
+        print(f"New story beat generated for session {session_id}: {story_beat.to_dict()}")
+        speculator.speculate(story)
         return jsonify({
             'success': True,
+            'session_id': session_id,
             'story_beat': story_beat.to_dict()
         })
     except Exception as e:
@@ -53,18 +125,37 @@ def update_story():
         
         choice_id = data.get('choice_id')
         success_result = data.get('success_result')
-        print(f"Received update request with choice_id: {choice_id}, success_result: {success_result}")
+        session_id = data.get('session_id')
+        print(f"Received update request for session {session_id} with choice_id: {choice_id}, success_result: {success_result}")
         
         if choice_id is None or success_result is None:
             return jsonify({
                 'success': False,
                 'error': 'Missing required fields: choice_id and success_result'
             }), 400
-        
-        story_beat = storyteller.continue_story(choice_id=choice_id, success_result=success_result)
+
+        if not session_id:
+            return jsonify({
+                'success': False,
+                'error': 'Missing required field: session_id'
+            }), 400
+
+        try:
+            story = sessions.get(session_id)
+        except KeyError as e:
+            return jsonify({
+                'success': False,
+                'error': str(e)
+            }), 404
+
+        story_beat = storyteller.continue_story(
+            story, choice_id=choice_id, success_result=success_result, speculator=speculator
+        )
         print(f"Story beat updated: {story_beat.to_dict()}")
+        speculator.speculate(story)
         return jsonify({
             'success': True,
+            'session_id': session_id,
             'story_beat': story_beat.to_dict()
         })
     except Exception as e:
@@ -74,12 +165,89 @@ def update_story():
             'error': str(e)
         }), 500
 
+def stream_story_events(session_id: str, story, events):
+    """
+    Relay Storyteller stream events as server-sent events.
+    Text arrives as 'text' events, a 'retry' event means the text so far should
+    be discarded, and the final 'beat' event carries the full story beat.
+    """
+    try:
+        for event, value in events:
+            if event == STREAM_BEAT:
+                print(f"Story beat streamed for session {session_id}: {value.to_dict()}")
+                yield sse_event(event, {
+                    'success': True,
+                    'session_id': session_id,
+                    'story_beat': value.to_dict()
+                })
+                speculator.speculate(story)
+            else:
+                yield sse_event(event, value)
+    except Exception as e:
+        print(e)
+        yield sse_event('error', {
+            'success': False,
+            'error': str(e)
+        })
+
+
+@app.route('/new/stream', methods=['GET'])
+def stream_new_story():
+    """GET endpoint to start a new story, streaming the beat text as it is generated"""
+    session_id, story = sessions.create()
+    events = storyteller.stream_new_story(story, pool=opening_pool)
+    return Response(
+        stream_with_context(stream_story_events(session_id, story, events)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'},
+    )
+
+@app.route('/update/stream', methods=['POST'])
+def stream_update_story():
+    """POST endpoint to continue the story, streaming the beat text as it is generated"""
+    data = request.get_json()
+    if not data or data.get('choice_id') is None or data.get('success_result') is None:
+        return jsonify({
+            'success': False,
+            'error': 'Missing required fields: choice_id and success_result'
+        }), 400
+
+    session_id = data.get('session_id')
+    if not session_id:
+        return jsonify({
+            'success': False,
+            'error': 'Missing required field: session_id'
+        }), 400
+
+    try:
+        story = sessions.get(session_id)
+    except KeyError as e:
+        return jsonify({
+            'success': False,
+            'error': str(e)
+        }), 404
+
+    events = storyteller.stream_continue_story(
+        story,
+        choice_id=data['choice_id'],
+        success_result=data['success_result'],
+        speculator=speculator,
+    )
+    return Response(
+        stream_with_context(stream_story_events(session_id, story, events)),
+        mimetype='text/event-stream',
+        headers={'Cache-Control': 'no-cache'},
+    )
+
 @app.route('/health', methods=['GET'])
 def health_check():
     """Health check endpoint"""
     return jsonify({
         'status': 'healthy',
-        'service': 'storyteller-api'
+        'service': 'storyteller-api',
+        'attempts_per_beat': storyteller.attempts_per_beat(),
+        'salvaged_beats': storyteller.salvaged,
+        'dashboard_cache': _dashboard.cache.stats() if _dashboard else None,
     })
 
 def handle_statistic(stat: Statistics):
@@ -87,13 +255,9 @@ def handle_statistic(stat: Statistics):
     print(f"Got {stat.type} = {stat.value} at {stat.timestamp!r}")
 
 
-@app.route('/stats', methods=['POST'])
-def post_stats():
-    payload = request.get_json(force=True)
-    try:
-        stat = Statistics.from_dict(payload)
-    except ValueError as e:
-        return jsonify({'error': str(e)}), 400
+def parse_statistic(payload) -> Statistics:
+    """Build a Statistics from a request payload. Raises ValueError if it is invalid."""
+    stat = Statistics.from_dict(payload)
 
     # Normalize timestamp
     ts = stat.timestamp
@@ -102,6 +266,16 @@ def post_stats():
             stat.timestamp = datetime.fromisoformat(ts) # type: ignore
         except Exception:
             pass
+    return stat
+
+
+@app.route('/stats', methods=['POST'])
+def post_stats():
+    payload = request.get_json(force=True)
+    try:
+        stat = parse_statistic(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
 
     # Business logic
     handle_statistic(stat)
@@ -110,5 +284,53 @@ def post_stats():
 
     return jsonify({'status': 'ok'}), 201
 
+def parse_statistics_batch(payload) -> list[Statistics]:
+    """Build the Statistics of a batch payload. Raises ValueError if any of them is invalid."""
+    if not isinstance(payload, list):
+        raise ValueError("Expected a JSON array of statistics")
+    stats = []
+    for i, item in enumerate(payload):
+        try:
+            stats.append(parse_statistic(item))
+        except ValueError as e:
+            raise ValueError(f"Statistic {i}: {e}")
+    return stats
+
+
+@app.route('/stats/batch', methods=['POST'])
+def post_stats_batch():
+    """POST endpoint for several statistics at once, stored in one transaction"""
+    payload = request.get_json(force=True)
+    try:
+        stats = parse_statistics_batch(payload)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+
+    for stat in stats:
+        handle_statistic(stat)
+    db.insert_many(stats)
+
+    return jsonify({'status': 'ok', 'count': len(stats)}), 201
+
+def startup():
+    """
+    Start the background workers. Not done on import, so importing this
+    module (tests, tools) is quick and makes no LLM calls.
+    """
+    opening_pool.start()
+
+
+def shutdown(timeout: float = 10.0):
+    """Stop the background workers, see asgi.py for graceful shutdown."""
+    opening_pool.stop(timeout)
+    shared_loop().stop()
+
+
 if __name__ == '__main__':
+    # Development server, use asgi.py in production.
+    # The reloader runs this module in a watcher process and a child serving
+    # requests; only the child starts the workers, or both would spend LLM
+    # calls and overwrite opening_pool.json.
+    if os.environ.get('WERKZEUG_RUN_MAIN') == 'true':
+        startup()
     app.run(debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,100 @@
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import Tuple
+from storyteller import Story
+
+# Idle sessions are dropped after this many seconds. A morning story rarely
+# lasts longer than half an hour, so two hours leaves plenty of slack.
+DEFAULT_TTL_S = 2 * 60 * 60
+# Upper bound on live stories, and on the (approximate) bytes they may hold
+DEFAULT_MAX_SESSIONS = 1000
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+
+
+class SessionStore:
+    """
+    Thread-safe store of live stories keyed by session id.
+    Least recently used sessions are evicted first, either when they have been
+    idle for longer than the TTL or when the store exceeds its size limits.
+    """
+
+    def __init__(
+        self,
+        ttl_s: float = DEFAULT_TTL_S,
+        max_sessions: int = DEFAULT_MAX_SESSIONS,
+        max_bytes: int = DEFAULT_MAX_BYTES,
+    ):
+        self.ttl_s = ttl_s
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        # session_id -> (story, last access time), oldest access first
+        self._sessions: "OrderedDict[str, Tuple[Story, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def create(self) -> Tuple[str, Story]:
+        """Start a new, empty story and return it with its session id."""
+        session_id = uuid.uuid4().hex
+        story = Story()
+        with self._lock:
+            self._sessions[session_id] = (story, time.monotonic())
+            self._evict()
+        return session_id, story
+
+    def get(self, session_id: str) -> Story:
+        """Fetch a live story and mark it as recently used."""
+        with self._lock:
+            self._evict()
+            if session_id not in self._sessions:
+                raise KeyError(f"Unknown or expired session: {session_id}")
+            story, _ = self._sessions.pop(session_id)
+            self._sessions[session_id] = (story, time.monotonic())
+            return story
+
+    def remove(self, session_id: str):
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def size_bytes(self) -> int:
+        with self._lock:
+            return sum(story.size_bytes() for story, _ in self._sessions.values())
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._sessions)
+
+    def _evict(self):
+        """Drop expired sessions, then the least recently used ones until within limits. Caller holds the lock."""
+        now = time.monotonic()
+        while self._sessions:
+            session_id, (_, last_used) = next(iter(self._sessions.items()))
+            if now - last_used <= self.ttl_s:
+                break
+            self._drop_oldest()
+
+        while len(self._sessions) > self.max_sessions:
+            self._drop_oldest()
+
+        total = sum(story.size_bytes() for story, _ in self._sessions.values())
+        while len(self._sessions) > 1 and total > self.max_bytes:
+            total -= self._drop_oldest().size_bytes()
+
+    def _drop_oldest(self) -> Story:
+        _, (story, _) = self._sessions.popitem(last=False)
+        return story
+
+    def __repr__(self):
+        return f"SessionStore({len(self)} sessions, ttl={self.ttl_s}s)"
+
+
+if __name__ == "__main__":
+    store = SessionStore(ttl_s=1, max_sessions=3)
+    ids = [store.create()[0] for _ in range(5)]
+    print(f"Created {len(ids)} sessions, {len(store)} kept: {store}")
+    store.get(ids[-1])
+    time.sleep(1.5)
+    try:
+        store.get(ids[-1])
+    except KeyError as e:
+        print(f"Expired as expected: {e}")
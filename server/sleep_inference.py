@@ -1,7 +1,11 @@
 from datetime import datetime, time, timedelta, date
-from bisect import bisect_left
-from typing import List
+from typing import List, Tuple
 from datetime import timezone
+import numpy as np
+
+EPOCH = datetime(1970, 1, 1, tzinfo=timezone.utc)
+# Ticks per second of the epoch times used internally
+MS, US = 1000, 1_000_000
 
 # define a simple record to hold each night’s data
 class SleepRecord:
@@ -24,6 +28,55 @@ def ensure_aware(dt):
         return dt.replace(tzinfo=timezone(timedelta(hours=+2)))
     return dt
 
+def _ticks(dt: datetime, unit: int) -> int:
+    """Time since the epoch in 1/unit seconds."""
+    return (dt - EPOCH) // (timedelta(seconds=1) / unit)
+
+
+def _sleep_indices(
+    interactions: np.ndarray,
+    wakeups: np.ndarray,
+    evening_start: time,
+    interaction_offset: int,
+    wakeup_offset: int,
+    unit: int,
+) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Core of infer_sleep_periods on sorted int64 epoch times in 1/unit seconds.
+    Calendar dates are taken at the given UTC offsets (same unit). Returns the
+    indices of the bedtime interaction and of the wakeup of each night.
+    """
+    day = 24 * 60 * 60 * unit
+    evening = (
+        (evening_start.hour * 60 + evening_start.minute) * 60 + evening_start.second
+    ) * unit + evening_start.microsecond * unit // 1_000_000
+
+    # Only the first wakeup of each day counts
+    wake_day = (wakeups + wakeup_offset) // day
+    first = np.ones(len(wakeups), dtype=bool)
+    first[1:] = wake_day[1:] != wake_day[:-1]
+    wake_idx = np.flatnonzero(first)
+    wakeups, wake_day = wakeups[first], wake_day[first]
+
+    # Interactions before each wakeup, and where its day and the day before
+    # start in interaction time
+    before = np.searchsorted(interactions, wakeups, side="left")
+    day_start = wake_day * day - interaction_offset
+    today = np.searchsorted(interactions, day_start, side="left")
+    tomorrow = np.searchsorted(interactions, day_start + day, side="left")
+
+    # Previous evening: latest interaction yesterday at or after evening_start
+    evening_lo = np.searchsorted(interactions, day_start - day + evening, side="left")
+    evening_hi = np.minimum(today, before)
+    has_evening = evening_hi > evening_lo
+    # Otherwise early morning: earliest interaction today before the wakeup
+    has_morning = np.minimum(tomorrow, before) > today
+
+    bedtime_idx = np.where(has_evening, evening_hi - 1, today)
+    keep = has_evening | has_morning
+    return bedtime_idx[keep], wake_idx[keep]
+
+
 def infer_sleep_periods(
     interactions: List[datetime],
     wakeups: List[datetime],
@@ -43,6 +96,9 @@ def infer_sleep_periods(
             else: skip
          d) duration = w - bedtime
       3) return a list of SleepRecords, sorted by date.
+    Each step is a binary search per wakeup, see _sleep_indices. Calendar
+    dates are taken in the time zone of the first interaction and of the
+    first wakeup respectively.
     """
 
     interactions = sorted(
@@ -53,40 +109,54 @@ def infer_sleep_periods(
         (ensure_aware(dt) if dt.tzinfo is None else dt)
         for dt in wakeups
     )
+    if not interactions or not wakeups:
+        return []
+
+    bedtime_idx, wakeup_idx = _sleep_indices(
+        np.fromiter((_ticks(t, US) for t in interactions), dtype=np.int64, count=len(interactions)),
+        np.fromiter((_ticks(w, US) for w in wakeups), dtype=np.int64, count=len(wakeups)),
+        evening_start,
+        interactions[0].utcoffset() // timedelta(microseconds=1),
+        wakeups[0].utcoffset() // timedelta(microseconds=1),
+        US,
+    )
     records = []
-    seen_days = set()
-    for w in wakeups:
-        day = w.date()
-        if day in seen_days:
-            continue
-        seen_days.add(day)
-
-        idx = bisect_left(interactions, w)
-        preceding = interactions[:idx]
-        if not preceding:
-            continue
-
-        day       = w.date()
-        yesterday = day - timedelta(days=1)
-
-        prev_evening = [
-            t for t in preceding
-            if t.date() == yesterday and t.time() >= evening_start
-        ]
-        if prev_evening:
-            bedtime = max(prev_evening)
-        else:
-            early_morning = [t for t in preceding if t.date() == day]
-            if not early_morning:
-                continue
-            bedtime = min(early_morning)
-
-        duration = w - bedtime
-        records.append(SleepRecord(date=day,
+    for i, j in zip(bedtime_idx, wakeup_idx):
+        bedtime, w = interactions[i], wakeups[j]
+        records.append(SleepRecord(date=w.date(),
                                    bedtime=bedtime,
                                    wakeup=w,
-                                   duration=duration))
+                                   duration=w - bedtime))
+    return records
 
+
+def infer_sleep_periods_ms(
+    interactions: np.ndarray,
+    wakeups: np.ndarray,
+    evening_start: time = time(18, 0),
+    utc_offset: timedelta = timedelta(0),
+) -> List[SleepRecord]:
+    """
+    infer_sleep_periods for int64 epoch-millisecond arrays, as returned by
+    StatisticsDB.query_columns. Calendar dates are taken at utc_offset, and
+    the records hold datetimes in that zone.
+    """
+    interactions = np.sort(np.asarray(interactions, dtype=np.int64))
+    wakeups = np.sort(np.asarray(wakeups, dtype=np.int64))
+    if not len(interactions) or not len(wakeups):
+        return []
+
+    offset = utc_offset // timedelta(milliseconds=1)
+    bedtime_idx, wakeup_idx = _sleep_indices(interactions, wakeups, evening_start, offset, offset, MS)
+    tz = timezone(utc_offset)
+    records = []
+    for i, j in zip(bedtime_idx, wakeup_idx):
+        bedtime = (EPOCH + timedelta(milliseconds=int(interactions[i]))).astimezone(tz)
+        w = (EPOCH + timedelta(milliseconds=int(wakeups[j]))).astimezone(tz)
+        records.append(SleepRecord(date=w.date(),
+                                   bedtime=bedtime,
+                                   wakeup=w,
+                                   duration=w - bedtime))
     return records
 
 
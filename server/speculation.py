@@ -0,0 +1,220 @@
+import asyncio
+import threading
+from concurrent.futures import Future
+from typing import Awaitable, Callable, Dict, List, Optional, Tuple
+from weakref import WeakKeyDictionary
+from models import (
+    Choice,
+    StoryBeat,
+    MODE_ADVANTAGE,
+    MODE_DISADVANTAGE,
+    SUCCESS_LEVELS,
+    PASSIVE_RESULT,
+)
+from event_loop import BackgroundLoop, shared_loop
+
+DISASTER, FAILURE, CLOSE_CALL, SOLID_SUCCESS, TRIUMPH = SUCCESS_LEVELS
+DIE_SIDES = 8
+# Default budget: branches generated per beat, and LLM calls running at once
+DEFAULT_MAX_BRANCHES = 8
+DEFAULT_MAX_WORKERS = 4
+
+BranchKey = Tuple[int, str]
+# A branch's future, and an event set once it has a worker and is generating
+Branch = Tuple[Future, threading.Event]
+
+
+def normalise_result(result: str) -> str:
+    """Make 'Solid Success.', 'solid success!' and 'Solid Success' compare equal."""
+    return result.strip().rstrip(".!").lower()
+
+
+def roll_outcome(roll: int, difficulty: int) -> str:
+    """Map a die roll to its outcome, following routines/dndroll.py."""
+    if roll == 1:
+        return DISASTER
+    if roll == DIE_SIDES:
+        return TRIUMPH
+    if roll == difficulty:
+        return CLOSE_CALL
+    if roll > difficulty:
+        return SOLID_SUCCESS
+    return FAILURE
+
+
+def outcome_probabilities(choice: Choice) -> Dict[str, float]:
+    """Probability of each outcome for a choice, taking advantage and disadvantage into account."""
+    if choice.difficulty == 0:
+        return {PASSIVE_RESULT: 1.0}
+    n = DIE_SIDES
+    probabilities: Dict[str, float] = {}
+    for roll in range(1, n + 1):
+        if choice.mode == MODE_ADVANTAGE:
+            # Highest of two dice equals roll
+            p = (roll**2 - (roll - 1) ** 2) / n**2
+        elif choice.mode == MODE_DISADVANTAGE:
+            # Lowest of two dice equals roll
+            p = ((n + 1 - roll) ** 2 - (n - roll) ** 2) / n**2
+        else:
+            p = 1 / n
+        outcome = roll_outcome(roll, choice.difficulty)
+        probabilities[outcome] = probabilities.get(outcome, 0.0) + p
+    return probabilities
+
+
+def likely_branches(beat: StoryBeat, max_branches: int) -> List[BranchKey]:
+    """
+    The most likely (choice, outcome) pairs following a beat, assuming every
+    choice is equally likely to be picked.
+    """
+    if not beat.choices:
+        return []
+    weighted = [
+        (p / len(beat.choices), choice.choice_id, outcome)
+        for choice in beat.choices
+        for outcome, p in outcome_probabilities(choice).items()
+    ]
+    weighted.sort(key=lambda w: w[0], reverse=True)
+    return [(choice_id, outcome) for _, choice_id, outcome in weighted[:max_branches]]
+
+
+class Speculator:
+    """
+    Generates likely continuations of a story in the background while the
+    player is still reading and rolling.
+    Branches run as coroutines on a shared event loop; take() hands out the
+    one matching the player's actual choice and outcome and cancels the rest,
+    including requests that are already in flight. A matching branch that is
+    still waiting for a worker is cancelled too: generating the beat on the
+    spot is quicker than queueing behind other stories' branches.
+    """
+
+    def __init__(
+        self,
+        agenerate: Callable[[object, int, str], Awaitable[StoryBeat]],
+        max_branches: int = DEFAULT_MAX_BRANCHES,
+        max_workers: int = DEFAULT_MAX_WORKERS,
+        loop: Optional[BackgroundLoop] = None,
+    ):
+        self.agenerate = agenerate
+        self.max_branches = max_branches
+        self.max_workers = max_workers
+        self.loop = loop or shared_loop()
+        self._semaphore: Optional[asyncio.Semaphore] = None
+        # Story -> pending branches; entries vanish along with evicted stories
+        self._branches: "WeakKeyDictionary[object, Dict[BranchKey, Branch]]" = WeakKeyDictionary()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def speculate(self, story):
+        """Start generating the likely continuations of the story's latest beat."""
+        self.discard(story)
+        if self.max_branches <= 0 or not story.story_beats:
+            return
+        beat = story.story_beats[-1]
+        if beat.is_ending:
+            return
+        snapshot = story.copy()
+        branches = {}
+        for choice_id, outcome in likely_branches(beat, self.max_branches):
+            started = threading.Event()
+            future = self.loop.submit(self._generate(snapshot, choice_id, outcome, started))
+            branches[(choice_id, normalise_result(outcome))] = (future, started)
+        with self._lock:
+            self._branches[story] = branches
+        print(f"Speculating on {len(branches)} branches")
+
+    async def _generate(self, story, choice_id: int, outcome: str, started: threading.Event) -> StoryBeat:
+        # Created on first use so it belongs to the loop's thread
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_workers)
+        async with self._semaphore:
+            started.set()
+            return await self.agenerate(story, choice_id, outcome)
+
+    def _claim(self, story, choice_id: int, success_result: str) -> Optional[Future]:
+        """
+        Pop the branch for this choice and outcome and cancel all others.
+        None if there is no such branch or it has not started generating yet,
+        in which case it is cancelled as well.
+        """
+        with self._lock:
+            branches = self._branches.pop(story, {})
+        branch = branches.pop((choice_id, normalise_result(success_result)), None)
+        self._cancel(branches)
+        if branch is None:
+            self.misses += 1
+            return None
+        future, started = branch
+        if not started.is_set():
+            future.cancel()
+        if future.cancelled():
+            self.misses += 1
+            return None
+        return future
+
+    def take(self, story, choice_id: int, success_result: str) -> Optional[StoryBeat]:
+        """
+        Return the speculated beat for this choice and outcome, waiting for it
+        if it is still being generated, or None if there is no usable branch
+        or it is still queued.
+        """
+        future = self._claim(story, choice_id, success_result)
+        if future is None:
+            return None
+        try:
+            beat = future.result()
+        except Exception as e:
+            print(f"Speculative branch failed: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return beat
+
+    async def atake(self, story, choice_id: int, success_result: str) -> Optional[StoryBeat]:
+        """Async version of take, waits for the branch without blocking the event loop."""
+        future = self._claim(story, choice_id, success_result)
+        if future is None:
+            return None
+        try:
+            beat = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Speculative branch failed: {e}")
+            self.misses += 1
+            return None
+        self.hits += 1
+        return beat
+
+    def discard(self, story):
+        """Drop all branches of a story."""
+        with self._lock:
+            branches = self._branches.pop(story, {})
+        self._cancel(branches)
+
+    @staticmethod
+    def _cancel(branches: Dict[BranchKey, Branch]):
+        for future, _ in branches.values():
+            future.cancel()
+
+    def __repr__(self):
+        return f"Speculator(max_branches={self.max_branches}, hits={self.hits}, misses={self.misses})"
+
+
+if __name__ == "__main__":
+    from models import MODE_NORMAL
+
+    beat = StoryBeat(
+        "The bridge sways above the chasm.",
+        [
+            Choice(1, "Run across", 5, MODE_NORMAL),
+            Choice(2, "Climb down", 6, MODE_DISADVANTAGE),
+            Choice(3, "Call out to the ferryman", 0),
+        ],
+        npcs=[],
+    )
+    for choice in beat.choices:
+        print(choice, {k: round(v, 3) for k, v in outcome_probabilities(choice).items()})
+    print("Most likely branches:", likely_branches(beat, DEFAULT_MAX_BRANCHES))
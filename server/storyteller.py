@@ -1,12 +1,23 @@
 import os
 import json
-from openai import OpenAI
-from typing import List, Optional, Tuple
+import asyncio
+from typing import Iterator, List, Optional, Tuple
 from models import StoryBeat, Choice
 from themes import get_random_themes
 from models import MODE_DISADVANTAGE, MODE_NORMAL, MODE_ADVANTAGE
 from llm import LLM
-from prompts import STORYTELLER_SYSTEM_PROMPT, get_new_story_prompt
+from beat_pool import BeatPool
+from speculation import Speculator
+from stream_parser import BeatTextExtractor, parse_llm_json, salvage_llm_json
+from event_loop import shared_loop
+from prompts import (
+    STORYTELLER_SYSTEM_PROMPT,
+    SUMMARY_SYSTEM_PROMPT,
+    SegmentedPrompt,
+    get_completion_prompt,
+    get_new_story_prompt,
+    get_summary_prompt,
+)
 from utils import get_api_keys
 import re
 from typing import Any
@@ -20,30 +31,167 @@ MAX_ATTEMPTS = 6
 LOW_VERBOSE, MEDIUM_VERBOSE, HIGH_VERBOSE = range(3)
 VERBOSITY = HIGH_VERBOSE
 LINE_STR = "-" * 80
+# Events yielded by the streaming methods of Storyteller
+STREAM_TEXT, STREAM_RETRY, STREAM_BEAT = "text", "retry", "beat"
+# Fields of a complete story beat, see STORYTELLER_SYSTEM_PROMPT
+BEAT_FIELDS = ["beat", "choices", "npcs", "atmosphere", "endstory"]
+
+# Number of most recent turns passed to the LLM verbatim. Older turns are
+# condensed to one line each so prompts stay bounded on long stories.
+# None keeps the whole history verbatim.
+HISTORY_WINDOW: Optional[int] = 12
+# Turns are condensed this many at a time, so between steps the prompt only
+# grows at the end and its prefix is read from the provider's prompt cache.
+# 1 condenses a turn every turn, which changes the prefix every turn.
+HISTORY_CONDENSE_STEP = 4
+# Characters of an older beat's opening kept in its condensed line
+COMPACT_BEAT_CHARS = 160
+SUMMARY_HEADER = "Summary of earlier events:\n"
+# Once the history passes this many (estimated) tokens, older turns are
+# summarised by the LLM in the background. None disables summarisation.
+SUMMARY_TOKEN_THRESHOLD: Optional[int] = 2500
+# Most recent turns that are never folded into the summary
+SUMMARY_KEEP_TURNS = 4
+CHARS_PER_TOKEN = 4
+
+
+def _compact_beat(story_beat: StoryBeat) -> str:
+    """First sentence of a beat, truncated, for condensed history lines."""
+    text = " ".join(story_beat.beat_text.split())
+    match = re.search(r"[.!?](\s|$)", text)
+    if match:
+        text = text[: match.start() + 1]
+    if len(text) > COMPACT_BEAT_CHARS:
+        text = text[: COMPACT_BEAT_CHARS - 3].rstrip() + "..."
+    return text
+
 
 class Story:
-    def __init__(self):
+    """
+    The beats and choices of one story.
+    Every beat and choice is rendered for the LLM once, when it is added, and
+    kept in append-only buffers, so building the history costs O(1) rendering
+    work per turn no matter how long the story gets.
+    """
+
+    def __init__(self, history_window: Optional[int] = HISTORY_WINDOW, condense_step: int = HISTORY_CONDENSE_STEP):
+        if history_window is not None and history_window < 1:
+            raise ValueError("history_window must be at least 1")
+        if history_window is not None and not 1 <= condense_step <= history_window:
+            raise ValueError("condense_step must be between 1 and history_window")
+        self.history_window = history_window
+        self.condense_step = condense_step
         self.story_beats: List[StoryBeat] = []
         self.choices: List[Tuple[Choice, str]] = []
+        self._size = 0
+        # Pre-rendered history, see get_history_segments
+        self._beat_lines: List[str] = []
+        self._choice_lines: List[str] = []
+        self._compact_lines: List[str] = []
+        self._turns: List[str] = []
+        self._compact_turns: List[str] = []
+        self._final_turns = 0  # Turns before this index have both beat and choice
+        # LLM-written summary of the first summary_turns turns, see Storyteller._asummarise
+        self.summary = ""
+        self.summary_turns = 0
+        self.summary_pending = False
 
     def add_story_beat(self, story_beat: StoryBeat):
         self.story_beats.append(story_beat)
+        self._size += len(story_beat.beat_text) + sum(len(c.label) for c in story_beat.choices)
+        self._beat_lines.append(f"Story beat: {story_beat.llm_format()}\n")
+        self._compact_lines.append(_compact_beat(story_beat))
 
     def add_choice(self, choice: Choice, roll_result: str):
         self.choices.append((choice, roll_result))
+        self._size += len(roll_result)
+        self._choice_lines.append(f"Choice: Tried {choice.label}. Result: {roll_result}\n")
+
+    def copy(self) -> "Story":
+        """Shallow copy that can be extended without affecting this story."""
+        story = Story(self.history_window, self.condense_step)
+        story.story_beats = self.story_beats.copy()
+        story.choices = self.choices.copy()
+        story._size = self._size
+        story._beat_lines = self._beat_lines.copy()
+        story._choice_lines = self._choice_lines.copy()
+        story._compact_lines = self._compact_lines.copy()
+        story._turns = self._turns.copy()
+        story._compact_turns = self._compact_turns.copy()
+        story._final_turns = self._final_turns
+        story.summary = self.summary
+        story.summary_turns = self.summary_turns
+        return story
+
+    def size_bytes(self) -> int:
+        """Approximate amount of text held by the story, used to cap session memory."""
+        return self._size
+
+    def _update_turns(self):
+        """Render the turns that changed since the last call, normally just the latest one."""
+        n_turns = max(len(self._beat_lines), len(self._choice_lines))
+        del self._turns[self._final_turns:]
+        for i in range(self._final_turns, n_turns):
+            turn = ""
+            if i < len(self._beat_lines):
+                turn += self._beat_lines[i]
+            if i < len(self._choice_lines):
+                turn += self._choice_lines[i]
+            self._turns.append(turn + "\n")
+        self._final_turns = min(len(self._beat_lines), len(self._choice_lines))
+
+    def _compact_turn(self, i: int) -> str:
+        line = f"- {self._compact_lines[i]}" if i < len(self._compact_lines) else "-"
+        if i < len(self.choices):
+            choice, roll_result = self.choices[i]
+            line += f" Tried {choice.label}. Result: {roll_result}"
+        return line + "\n"
+
+    def get_history_segments(self) -> List[str]:
+        """
+        The story history split into one segment per turn (a beat and the choice
+        made in it). Turns covered by the LLM-written summary are replaced by it.
+        With a history window, remaining turns older than the window are
+        condensed to one line each under a summary header, condense_step
+        turns at a time.
+        """
+        self._update_turns()
+        segments = [f"Story so far:\n{self.summary}\n\n"] if self.summary else []
+        first = self.summary_turns
+        if self.history_window is None or len(self._turns) - first <= self.history_window:
+            return segments + self._turns[first:]
+        # Round up to whole steps: between steps only verbatim turns are added
+        step = self.condense_step
+        n_older = -(-(len(self._turns) - self.history_window) // step) * step
+        # Condensed lines of finished turns never change, so render them once
+        while len(self._compact_turns) < min(n_older, self._final_turns):
+            self._compact_turns.append(self._compact_turn(len(self._compact_turns)))
+        compact = [
+            *self._compact_turns[first:n_older],
+            *(self._compact_turn(i) for i in range(max(first, len(self._compact_turns)), n_older)),
+        ]
+        # The blank line after the condensed block goes in its last segment:
+        # providers reject content blocks that are only whitespace
+        compact[-1] += "\n"
+        return segments + [SUMMARY_HEADER, *compact, *self._turns[n_older:]]
+
+    def estimated_tokens(self) -> int:
+        """Rough token count of the history as it would be sent to the LLM."""
+        return sum(len(segment) for segment in self.get_history_segments()) // CHARS_PER_TOKEN
+
+    def unsummarised_turns(self, keep: int) -> Tuple[int, str]:
+        """
+        Finished turns not yet covered by the summary, leaving out the most
+        recent `keep` turns. Returns the index the summary would reach and the
+        verbatim text of those turns.
+        """
+        self._update_turns()
+        end = max(self.summary_turns, min(self._final_turns, len(self._turns) - keep))
+        return end, "".join(self._turns[self.summary_turns:end])
 
     def get_story_history(self) -> str:
         """Get the history of the story so far. Includes the story beats and the choices made."""
-        history = ""
-        beats = self.story_beats.copy()
-        choices = self.choices.copy()
-        while beats or choices:
-            if beats:
-                history += f"Story beat: {beats.pop(0).llm_format()}\n"
-            if choices:
-                choice_tuple = choices.pop(0)
-                history += f"Choice: Tried {choice_tuple[0].label}. Result: {choice_tuple[1]}\n"
-            history += "\n"
+        history = "".join(self.get_history_segments())
         if VERBOSITY >= HIGH_VERBOSE:
             print(f"Story history to be passed to LLM:\n{LINE_STR}\n{history}\n{LINE_STR}")
         return history
@@ -54,144 +202,461 @@ class Storyteller:
     A class to generate and progress interactive DnD-style stories using OpenAI's Chat API.
     """
 
-    def __init__(self, llm: LLM):
+    def __init__(
+        self,
+        llm: LLM,
+        summary_llm: Optional[LLM] = None,
+        summary_token_threshold: Optional[int] = SUMMARY_TOKEN_THRESHOLD,
+    ):
         self.llm = llm
+        # Summaries are plain text, so use a backend that doesn't validate or constrain story beats
+        self.summary_llm = summary_llm or llm
+        self.summary_token_threshold = summary_token_threshold
+        # LLM round trips per beat, including retries
+        self.beats_requested = 0
+        self.attempts_total = 0
+        # Cut-off responses completed by asking only for the missing fields
+        self.salvaged = 0
         print(f"Initializing Storyteller with model {self.llm}")
 
+    def maybe_summarise(self, story: Story):
+        """
+        Start summarising older turns in the background once the history is
+        over the token threshold. The summary is used by later prompts as soon
+        as it is ready; the current request never waits for it.
+        """
+        if self.summary_token_threshold is None or story.summary_pending:
+            return
+        if story.estimated_tokens() <= self.summary_token_threshold:
+            return
+        end, history = story.unsummarised_turns(SUMMARY_KEEP_TURNS)
+        if not history:
+            return
+        story.summary_pending = True
+        shared_loop().submit(self._asummarise(story, end, history))
+
+    async def _asummarise(self, story: Story, end: int, history: str):
+        try:
+            prompt = get_summary_prompt(story.summary, history)
+            summary = await self.summary_llm.agenerate(SUMMARY_SYSTEM_PROMPT, prompt)
+            summary = summary.strip()
+            if not summary:
+                raise ValueError("Empty summary")
+            story.summary, story.summary_turns = summary, end
+            if VERBOSITY >= MEDIUM_VERBOSE:
+                print(f"Story summarised up to turn {end}:\n{LINE_STR}\n{summary}\n{LINE_STR}")
+        except Exception as e:
+            print(f"Failed to summarise story: {e}")
+        finally:
+            story.summary_pending = False
+
     @staticmethod
     def parse_llm_json_response(raw: str) -> dict[str, Any]:
         """
-        Robustly parse JSON from LLM response, handling common formatting issues.
+        Robustly parse JSON from LLM response, handling common formatting issues
+        such as code fences, unescaped quotes and trailing commas.
         """
-        # Remove any leading/trailing whitespace
-        raw = raw.strip()
-        
-        # Remove markdown code blocks if present
-        # Handle ```json, ```JSON, or just ```
-        raw = re.sub(r'^```(?:json|JSON)?\s*\n', '', raw)
-        raw = re.sub(r'\n```\s*$', '', raw)
+        return parse_llm_json(raw)
+
+    @staticmethod
+    def _beat_from_raw(raw: str, attempt: int = 1) -> StoryBeat:
+        """
+        Parse a raw LLM response, validate it and convert it to a StoryBeat.
+        Raises ValueError (or a JSON error) if the response is unusable.
+        """
+        if VERBOSITY >= HIGH_VERBOSE:
+            print(f"Raw response from LLM (attempt {attempt}):\n{LINE_STR}\n{raw}\n{LINE_STR}")
+        data = Storyteller.parse_llm_json_response(raw)
+        if VERBOSITY >= HIGH_VERBOSE:
+            print(f"Parsed JSON data (attempt {attempt}):\n{LINE_STR}\n{data}\n{LINE_STR}")
+        return Storyteller._beat_from_data(data)
+
+    @staticmethod
+    def _beat_from_data(data: Any) -> StoryBeat:
+        """Validate parsed response data and convert it to a StoryBeat."""
+        # Validate required fields
+        if not isinstance(data, dict):
+            raise ValueError("Response must be a JSON object")
         
-        # If it still doesn't start with { or [, try to find JSON in the response
-        if not raw.startswith(('{', '[')):
-            # Look for JSON object in the response
-            json_match = re.search(r'(\{[^{}]*\{[^{}]*\}[^{}]*\}|\{[^{}]+\})', raw, re.DOTALL)
-            if json_match:
-                raw = json_match.group(1)
+        if "beat" not in data:
+            raise ValueError("Missing required field: beat")
+
+
+        # Parse choices
+        choices: List[Choice] = []
+        choice_data = data.get("choices", [])
         
-        # Try to parse the JSON
-        try:
-            return json.loads(raw)
-        except json.JSONDecodeError as e:
-            # Common issue: unescaped quotes in strings
-            # Try to fix by escaping quotes that aren't already escaped
-            fixed = re.sub(r'(?<!\\)"(?=(?:[^"]*"[^"]*")*[^"]*"[^"]*$)', r'\"', raw)
+        for choice_item in choice_data:
             try:
-                return json.loads(fixed)
-            except:
-                # If that fails, raise the original error
-                raise e
+                choice = Storyteller._parse_choice(choice_item)
+            except (ValueError, AttributeError, KeyError, TypeError) as e:
+                print(f"Warning: Skipping malformed choice '{choice_item}': {e}")
+                continue
+            if any(c.choice_id == choice.choice_id for c in choices):
+                print(f"Warning: Skipping duplicate choice '{choice_item}'")
+                continue
+            choices.append(choice)
+
 
+        if VERBOSITY >= HIGH_VERBOSE:
+            print(f"Parsed choices: {choices}")
+
+        # Build beat
+        return StoryBeat(
+            beat_text=data.get("beat"),
+            choices=choices,
+            npcs=data.get("npcs", []),
+            atmosphere=data.get("atmosphere", ""),
+            is_ending=data.get("endstory", False)
+        )
 
-    def _request_story_beat(self, user_content: str) -> StoryBeat | None:
+    @staticmethod
+    def _parse_choice(choice_item: Any) -> Choice:
         """
-        Send messages to the LLM, parse JSON response, convert to StoryBeat, and record history.
+        Parse a choice, either an object from structured output or an
+        'index,choice_text,difficulty,roll_mode' string from free text.
         """
-        for attempt in range(1, MAX_ATTEMPTS + 1):
+        mode_map = {"1": MODE_ADVANTAGE, "-1": MODE_DISADVANTAGE, "0": MODE_NORMAL}
+        if isinstance(choice_item, dict):
+            return Choice(
+                choice_id=int(choice_item["index"]),
+                label=str(choice_item["text"]).strip(),
+                difficulty=int(choice_item["difficulty"]),
+                mode=mode_map.get(str(choice_item.get("roll_mode", 0)), MODE_NORMAL),
+            )
+
+        parts = choice_item.split(",", 3)
+        if len(parts) < 4:
+            raise ValueError("expected 'index,choice_text,difficulty,roll_mode'")
+        cid, label, diff, mode = parts
+        return Choice(
+            choice_id=int(cid.strip()),
+            label=label.strip(),
+            difficulty=int(diff.strip()),
+            mode=mode_map.get(mode.strip(), MODE_NORMAL),
+        )
+
+    def _record_attempts(self, attempts: int):
+        """Track how many LLM round trips each beat took."""
+        self.beats_requested += 1
+        self.attempts_total += attempts
+        if VERBOSITY >= MEDIUM_VERBOSE:
+            print(f"Beat took {attempts} attempt(s), {self.attempts_per_beat():.2f} per beat on average")
+
+    def attempts_per_beat(self) -> float:
+        return self.attempts_total / self.beats_requested if self.beats_requested else 0.0
+
+    def _salvage_request(self, raw: str, user_content: str) -> Optional[Tuple[dict, Optional[str], str]]:
+        """
+        For a response that was cut off after the beat text, return the fields
+        that arrived complete, the name of the list to continue (if any) and a
+        prompt asking only for the rest. None if there is nothing to salvage.
+        """
+        try:
+            data, cut_off = salvage_llm_json(raw)
+        except ValueError:
+            return None
+        if not isinstance(data, dict) or not isinstance(data.get("beat"), str) or not data["beat"]:
+            return None
+        if not isinstance(data.get(cut_off), list):
+            cut_off = None
+        missing = [field for field in BEAT_FIELDS if field not in data]
+        if not missing and not cut_off:
+            return None
+        completion = get_completion_prompt(json.dumps(data, ensure_ascii=False), missing, cut_off)
+        # Keep the original segments so the prompt cache still applies
+        segments = getattr(user_content, "segments", [user_content])
+        return data, cut_off, SegmentedPrompt([*segments, completion])
+
+    @staticmethod
+    def _merge_salvage(data: dict, cut_off: Optional[str], raw: str) -> StoryBeat:
+        """Fill the salvaged fields in with the LLM's completion of them."""
+        completion = Storyteller.parse_llm_json_response(raw)
+        if not isinstance(completion, dict):
+            raise ValueError("Response must be a JSON object")
+        merged = dict(data)
+        for field in BEAT_FIELDS:
+            if field == cut_off:
+                merged[field] = data[field] + [item for item in completion.get(field, []) if item not in data[field]]
+            elif field not in data and field in completion:
+                merged[field] = completion[field]
+        if VERBOSITY >= HIGH_VERBOSE:
+            print(f"Salvaged JSON data:\n{LINE_STR}\n{merged}\n{LINE_STR}")
+        return Storyteller._beat_from_data(merged)
+
+    def _salvage_beat(self, raw: str, user_content: str, attempt: int) -> StoryBeat | None:
+        """
+        Complete a cut-off response by asking the LLM only for the missing
+        fields. Returns None if the response can't be salvaged.
+        """
+        salvage = self._salvage_request(raw, user_content)
+        if salvage is None:
+            return None
+        data, cut_off, prompt = salvage
+        print(f"Salvaging attempt {attempt}, asking for the missing fields")
+        try:
+            beat = Storyteller._merge_salvage(data, cut_off, self.llm.generate(STORYTELLER_SYSTEM_PROMPT, prompt))
+        except Exception as e:
+            print(f"Salvage of attempt {attempt} failed: {e}")
+            return None
+        self.salvaged += 1
+        return beat
+
+    async def _asalvage_beat(self, raw: str, user_content: str, attempt: int) -> StoryBeat | None:
+        """Async version of _salvage_beat."""
+        salvage = self._salvage_request(raw, user_content)
+        if salvage is None:
+            return None
+        data, cut_off, prompt = salvage
+        print(f"Salvaging attempt {attempt}, asking for the missing fields")
+        try:
+            raw = await self.llm.agenerate(STORYTELLER_SYSTEM_PROMPT, prompt)
+            beat = Storyteller._merge_salvage(data, cut_off, raw)
+        except asyncio.CancelledError:
+            raise
+        except Exception as e:
+            print(f"Salvage of attempt {attempt} failed: {e}")
+            return None
+        self.salvaged += 1
+        return beat
+
+    def _request_story_beat(self, user_content: str, first_attempt: int = 1) -> StoryBeat | None:
+        """
+        Send messages to the LLM, parse JSON response and convert to StoryBeat.
+        A response that was cut off after the beat text is salvaged rather
+        than requested again.
+        """
+        for attempt in range(first_attempt, MAX_ATTEMPTS + 1):
+            raw = None
             try:
                 raw = self.llm.generate(STORYTELLER_SYSTEM_PROMPT, user_content)
-                if VERBOSITY >= HIGH_VERBOSE:
-                    print(f"Raw response from LLM (attempt {attempt}):\n{LINE_STR}\n{raw}\n{LINE_STR}")
-                data = Storyteller.parse_llm_json_response(raw)
-                if VERBOSITY >= HIGH_VERBOSE:
-                    print(f"Parsed JSON data (attempt {attempt}):\n{LINE_STR}\n{data}\n{LINE_STR}")
-                    
-                # Validate required fields
-                if not isinstance(data, dict):
-                    raise ValueError("Response must be a JSON object")
-                
-                if "beat" not in data:
-                    raise ValueError("Missing required field: beat")
-
-
-                # Parse choices
-                choices: List[Choice] = []
-                choice_data = data.get("choices", [])
-                
-                for choice_str in choice_data:
-                    try:
-                        parts = choice_str.split(",", 3)
-                        if len(parts) < 4:
-                            print(f"Warning: Skipping malformed choice: {choice_str}")
-                            continue
-                            
-                        cid, label, diff, mode = parts
-                        mode_map = {"1": MODE_ADVANTAGE, "-1": MODE_DISADVANTAGE, "0": MODE_NORMAL}
-                        
-                        choices.append(
-                            Choice(
-                                choice_id=int(cid.strip()),
-                                label=label.strip(),
-                                difficulty=int(diff.strip()),
-                                mode=mode_map.get(mode.strip(), MODE_NORMAL),
-                            )
-                        )
-                    except (ValueError, AttributeError) as e:
-                        print(f"Warning: Error parsing choice '{choice_str}': {e}")
-                        continue
-
-
-                if VERBOSITY >= HIGH_VERBOSE:
-                    print(f"Parsed choices: {choices}")
-
-                # Build beat
-                story_beat = StoryBeat(
-                    beat_text=data.get("beat"),
-                    choices=choices,
-                    npcs=data.get("npcs", []),
-                    atmosphere=data.get("atmosphere", ""),
-                    is_ending=data.get("endstory", False)
-                )
-
-                # Record
-                self.story.add_story_beat(story_beat)
-                return story_beat
+                beat = Storyteller._beat_from_raw(raw, attempt)
+                self._record_attempts(attempt)
+                return beat
+            except Exception as e:
+                print(f"Attempt {attempt} failed: {e}")
+                beat = self._salvage_beat(raw, user_content, attempt) if raw else None
+                if beat:
+                    self._record_attempts(attempt)
+                    return beat
+                if attempt == MAX_ATTEMPTS:
+                    self._record_attempts(attempt)
+                    raise
 
+    async def _arequest_story_beat(self, user_content: str) -> StoryBeat | None:
+        """Async version of _request_story_beat."""
+        for attempt in range(1, MAX_ATTEMPTS + 1):
+            raw = None
+            try:
+                raw = await self.llm.agenerate(STORYTELLER_SYSTEM_PROMPT, user_content)
+                beat = Storyteller._beat_from_raw(raw, attempt)
+                self._record_attempts(attempt)
+                return beat
+            except asyncio.CancelledError:
+                raise
             except Exception as e:
                 print(f"Attempt {attempt} failed: {e}")
+                beat = await self._asalvage_beat(raw, user_content, attempt) if raw else None
+                if beat:
+                    self._record_attempts(attempt)
+                    return beat
                 if attempt == MAX_ATTEMPTS:
+                    self._record_attempts(attempt)
                     raise
 
-    def generate_new_story(self) -> StoryBeat:
-        """Generate a new story beat with up to 8 choices."""
+    def _stream_story_beat(self, user_content: str) -> Iterator[Tuple[str, Any]]:
+        """
+        Like _request_story_beat, but streams the beat text while the LLM writes it.
+        Yields (STREAM_TEXT, text) for every new piece of beat text and finally
+        (STREAM_BEAT, StoryBeat). If the streamed response turns out to be
+        invalid, (STREAM_RETRY, None) tells the consumer to discard the text
+        shown so far, and the remaining attempts are made without streaming.
+        A response cut off after the beat text is salvaged without a retry.
+        """
+        extractor = BeatTextExtractor()
+        raw_chunks: List[str] = []
+        try:
+            for chunk in self.llm.stream(STORYTELLER_SYSTEM_PROMPT, user_content):
+                raw_chunks.append(chunk)
+                text = extractor.feed(chunk)
+                if text:
+                    yield STREAM_TEXT, text
+            beat = Storyteller._beat_from_raw("".join(raw_chunks))
+            self._record_attempts(1)
+        except Exception as e:
+            print(f"Attempt 1 failed: {e}")
+            beat = self._salvage_beat("".join(raw_chunks), user_content, 1) if raw_chunks else None
+            if beat:
+                self._record_attempts(1)
+            elif MAX_ATTEMPTS == 1:
+                raise
+            else:
+                beat = self._request_story_beat(user_content, first_attempt=2)
+                if not beat:
+                    raise ValueError("Failed to generate a story beat")
+            if beat.beat_text != extractor.text:
+                if extractor.text:
+                    yield STREAM_RETRY, None
+                yield STREAM_TEXT, beat.beat_text
+        yield STREAM_BEAT, beat
+
+    def _opening_prompt(self) -> str:
         themes = " ".join(get_random_themes())
-        self.story = Story()
         print(f"Generating new story with themes: {themes}")
-        prompt = get_new_story_prompt(themes)
-        beat = self._request_story_beat(prompt)
+        return get_new_story_prompt(themes)
+
+    def generate_opening_beat(self) -> StoryBeat:
+        """Generate an opening beat with random themes and up to 8 choices."""
+        beat = self._request_story_beat(self._opening_prompt())
         if not beat:
             raise ValueError("Failed to generate a new story beat")
         return beat
 
-    def continue_story(self, choice_id: int, success_result: str) -> StoryBeat:
-        """Continue the story based on a player's choice and its outcome."""
-        print(f"Current Story Beats: {len(self.story.story_beats)}")
-        current = self.story.story_beats[-1] if self.story.story_beats else None
+    async def agenerate_opening_beat(self) -> StoryBeat:
+        """Async version of generate_opening_beat."""
+        beat = await self._arequest_story_beat(self._opening_prompt())
+        if not beat:
+            raise ValueError("Failed to generate a new story beat")
+        return beat
+
+    def generate_new_story(self, story: Story, pool: Optional[BeatPool] = None) -> StoryBeat:
+        """
+        Start an empty story. The opening beat is taken from the pool when one
+        is ready, otherwise it is generated on the spot.
+        """
+        beat = pool.pop() if pool else None
+        if beat is None:
+            beat = self.generate_opening_beat()
+        story.add_story_beat(beat)
+        return beat
+
+    async def anew_story(self, story: Story, pool: Optional[BeatPool] = None) -> StoryBeat:
+        """Async version of generate_new_story."""
+        beat = pool.pop() if pool else None
+        if beat is None:
+            beat = await self.agenerate_opening_beat()
+        story.add_story_beat(beat)
+        return beat
+
+    def stream_new_story(self, story: Story, pool: Optional[BeatPool] = None) -> Iterator[Tuple[str, Any]]:
+        """Streaming version of generate_new_story, see _stream_story_beat for the events."""
+        beat = pool.pop() if pool else None
+        if beat is None:
+            for event, value in self._stream_story_beat(self._opening_prompt()):
+                if event == STREAM_BEAT:
+                    beat = value
+                else:
+                    yield event, value
+        else:
+            yield STREAM_TEXT, beat.beat_text
+        story.add_story_beat(beat)
+        yield STREAM_BEAT, beat
+
+    @staticmethod
+    def _find_choice(story: Story, choice_id: int) -> Choice:
+        """Look up a choice of the latest beat in the story."""
+        current = story.story_beats[-1] if story.story_beats else None
         if not current:
             raise ValueError("No story beat available to continue from")
         chosen = next((c for c in current.choices if c.choice_id == choice_id), None)
         if not chosen:
             raise ValueError(f"Choice with ID {choice_id} not found")
+        return chosen
 
-        self.story.add_choice(chosen, success_result)
-        history = self.story.get_story_history()
-        prompt = f"Story history:\n{history}\n\nGenerate the next story beat and choices based on this outcome."
+    def _continuation_prompt(self, story: Story, choice_id: int, success_result: str) -> SegmentedPrompt:
+        """Prompt for the beat that follows a choice and its outcome, without modifying the story."""
+        chosen = self._find_choice(story, choice_id)
+        branch = story.copy()
+        branch.add_choice(chosen, success_result)
+        # Segmented so backends can cache the history, which only grows between turns
+        prompt = SegmentedPrompt([
+            "Story history:\n",
+            *branch.get_history_segments(),
+            "\n\nGenerate the next story beat and choices based on this outcome.",
+        ])
         if VERBOSITY >= HIGH_VERBOSE:
             print(f"Continuing story with prompt:\n{LINE_STR}{prompt}\n{LINE_STR}")
-        beat = self._request_story_beat(prompt)
+        return prompt
+
+    def generate_continuation(self, story: Story, choice_id: int, success_result: str) -> StoryBeat:
+        """Generate the beat that follows a choice and its outcome, without modifying the story."""
+        beat = self._request_story_beat(self._continuation_prompt(story, choice_id, success_result))
+        if not beat:
+            raise ValueError("Failed to continue the story")
+        return beat
+
+    async def agenerate_continuation(self, story: Story, choice_id: int, success_result: str) -> StoryBeat:
+        """Async version of generate_continuation."""
+        beat = await self._arequest_story_beat(self._continuation_prompt(story, choice_id, success_result))
         if not beat:
             raise ValueError("Failed to continue the story")
         return beat
 
+    def continue_story(
+        self,
+        story: Story,
+        choice_id: int,
+        success_result: str,
+        speculator: Optional[Speculator] = None,
+    ) -> StoryBeat:
+        """
+        Continue the story based on a player's choice and its outcome.
+        A speculatively generated branch is used when one matches, otherwise
+        the beat is generated on the spot.
+        """
+        print(f"Current Story Beats: {len(story.story_beats)}")
+        chosen = self._find_choice(story, choice_id)
+        beat = speculator.take(story, choice_id, success_result) if speculator else None
+        if beat is None:
+            beat = self.generate_continuation(story, choice_id, success_result)
+        story.add_choice(chosen, success_result)
+        story.add_story_beat(beat)
+        self.maybe_summarise(story)
+        return beat
+
+    async def acontinue_story(
+        self,
+        story: Story,
+        choice_id: int,
+        success_result: str,
+        speculator: Optional[Speculator] = None,
+    ) -> StoryBeat:
+        """Async version of continue_story."""
+        print(f"Current Story Beats: {len(story.story_beats)}")
+        chosen = self._find_choice(story, choice_id)
+        beat = await speculator.atake(story, choice_id, success_result) if speculator else None
+        if beat is None:
+            beat = await self.agenerate_continuation(story, choice_id, success_result)
+        story.add_choice(chosen, success_result)
+        story.add_story_beat(beat)
+        self.maybe_summarise(story)
+        return beat
+
+    def stream_continue_story(
+        self,
+        story: Story,
+        choice_id: int,
+        success_result: str,
+        speculator: Optional[Speculator] = None,
+    ) -> Iterator[Tuple[str, Any]]:
+        """Streaming version of continue_story, see _stream_story_beat for the events."""
+        print(f"Current Story Beats: {len(story.story_beats)}")
+        chosen = self._find_choice(story, choice_id)
+        beat = speculator.take(story, choice_id, success_result) if speculator else None
+        if beat is None:
+            prompt = self._continuation_prompt(story, choice_id, success_result)
+            for event, value in self._stream_story_beat(prompt):
+                if event == STREAM_BEAT:
+                    beat = value
+                else:
+                    yield event, value
+        else:
+            yield STREAM_TEXT, beat.beat_text
+        story.add_choice(chosen, success_result)
+        story.add_story_beat(beat)
+        self.maybe_summarise(story)
+        yield STREAM_BEAT, beat
+
 if __name__ == "__main__":
     from llm import OpenAILLM
     api_key_openai = get_api_keys().get("openai")
@@ -199,7 +664,8 @@ if __name__ == "__main__":
     storyteller = Storyteller(OpenAILLM(api_key_openai)) # type: ignore
 
     # Generate initial story
-    initial_beat = storyteller.generate_new_story()
+    story = Story()
+    initial_beat = storyteller.generate_new_story(story)
     print("=== INITIAL STORY ===")
     print(initial_beat.beat_text)
     print("\nChoices:")
@@ -208,11 +674,11 @@ if __name__ == "__main__":
 
     # Continue story with a choice
     print("\n=== CONTINUING STORY ===")
-    next_beat = storyteller.continue_story(choice_id=1, success_result="Solid Success.")
+    next_beat = storyteller.continue_story(story, choice_id=1, success_result="Solid Success.")
     print(next_beat.beat_text)
     print("\nNew Choices:")
     for choice in next_beat.choices:
         print(f"  {choice}")
 
     print("\n=== STORY HISTORY ===")
-    print(storyteller.story.get_story_history())
+    print(story.get_story_history())
@@ -0,0 +1,349 @@
+import json
+import re
+from typing import Any, List, Optional, Tuple
+
+# JSON escape sequences and the characters they stand for
+ESCAPES = {'"': '"', "\\": "\\", "/": "/", "b": "\b", "f": "\f", "n": "\n", "r": "\r", "t": "\t"}
+# Control characters that are not allowed raw inside JSON strings
+CONTROL_ESCAPES = {"\n": "\\n", "\r": "\\r", "\t": "\\t", "\b": "\\b", "\f": "\\f"}
+# Characters that need attention inside and outside of strings
+STRING_SPECIAL = re.compile(r'["\\\x00-\x1f]')
+STRUCTURE_SPECIAL = re.compile(r'["{}\[\]]')
+OBJECT_START = re.compile(r"[{\[]")
+WHITESPACE = " \t\r\n"
+# Characters that can start the value or key following a comma
+VALUE_START = set('"{[}]-0123456789tfn')
+
+
+class BeatTextExtractor:
+    """
+    Incrementally pulls the value of the top-level "beat" field out of a JSON
+    object that arrives in chunks, so the text can be shown before the rest of
+    the object (choices, npcs, ...) has been generated.
+    Anything before the opening brace, such as a markdown code fence, is ignored.
+
+        extractor = BeatTextExtractor()
+        for chunk in stream:
+            new_text = extractor.feed(chunk)
+    """
+
+    def __init__(self, field: str = "beat"):
+        self.field = field
+        self.text = ""  # Beat text decoded so far
+        self.done = False  # Whether the closing quote of the field was seen
+        self._depth = 0
+        self._in_string = False
+        self._capturing = False
+        self._string: List[str] = []  # Current top-level string, possibly a key
+        self._key: Optional[str] = None  # Last top-level key followed by ':'
+        self._last_string: Optional[str] = None
+        self._escape = ""  # Pending escape sequence split across chunks
+
+    def feed(self, chunk: str) -> str:
+        """Consume a chunk and return the beat text decoded from it."""
+        if self.done:
+            return ""
+        out: List[str] = []
+        for ch in chunk:
+            if self._in_string:
+                self._string_char(ch, out)
+                if self.done:
+                    break
+            elif ch == '"':
+                self._in_string = True
+                self._string = []
+                self._capturing = self._depth == 1 and self._key == self.field
+            elif ch in "{[":
+                self._depth += 1
+            elif ch in "}]":
+                self._depth -= 1
+            elif self._depth == 1 and ch == ":":
+                self._key = self._last_string
+            elif self._depth == 1 and ch == ",":
+                self._key = None
+        new_text = "".join(out)
+        self.text += new_text
+        return new_text
+
+    def _string_char(self, ch: str, out: List[str]):
+        if self._escape:
+            self._escape += ch
+            decoded = self._decode_escape()
+            if decoded is not None:
+                self._escape = ""
+                if self._capturing:
+                    out.append(decoded)
+                elif self._depth == 1:
+                    self._string.append(decoded)
+        elif ch == "\\":
+            self._escape = ch
+        elif ch == '"':
+            self._in_string = False
+            if self._capturing:
+                self._capturing = False
+                self.done = True
+            elif self._depth == 1:
+                self._last_string = "".join(self._string)
+        elif self._capturing:
+            out.append(ch)
+        elif self._depth == 1:
+            self._string.append(ch)
+
+    def _decode_escape(self) -> Optional[str]:
+        """Decode the pending escape, or None if more characters are needed."""
+        kind = self._escape[1]
+        if kind != "u":
+            return ESCAPES.get(kind, kind)
+        if len(self._escape) < 6:
+            return None
+        try:
+            return chr(int(self._escape[2:6], 16))
+        except ValueError:
+            return self._escape
+
+
+class TolerantJSONParser:
+    """
+    Single-pass, linear-time parser for the JSON objects LLMs produce.
+    Input can be fed in chunks as it streams in. While scanning, it
+      - skips anything before the outermost object, such as a code fence or prose,
+        and anything after it,
+      - escapes quotes inside strings that don't end the string, judged by
+        the character that follows them,
+      - escapes raw newlines and other control characters inside strings,
+      - drops trailing commas before a closing brace or bracket.
+    The repaired text is decoded with json once the object is complete.
+    """
+
+    def __init__(self):
+        self._pending = ""  # Input not processed yet, waiting for lookahead
+        self._out: List[str] = []  # Repaired JSON text
+        self._started = False
+        self._depth = 0
+        self._in_string = False
+        self._escape = False
+        self.complete = False  # Whether the outermost object has been closed
+
+    def feed(self, chunk: str):
+        """Consume a chunk of the response."""
+        if not self.complete:
+            self._pending += chunk
+            self._process(final=False)
+
+    def result(self) -> Any:
+        """Finish parsing and return the decoded object."""
+        self._process(final=True)
+        if not self.complete:
+            raise ValueError("Incomplete JSON object in LLM response")
+        return json.loads(self.repaired_text())
+
+    def repaired_text(self) -> str:
+        """The repaired JSON text produced so far."""
+        return "".join(self._out)
+
+    def salvage(self) -> Tuple[Any, Optional[str]]:
+        """
+        Recover what is usable from a response that was cut off, e.g. because
+        the token limit was reached. Returns the object with every top-level
+        field that arrived complete, plus the name of the field that was cut
+        off (None if the cut fell between fields). Lists keep their complete
+        items, so a cut-off list can be continued. A complete object is
+        returned as is. Returns (None, None) if no object was started.
+        """
+        self._process(final=True)
+        if self.complete:
+            return json.loads(self.repaired_text()), None
+        if not self._started:
+            return None, None
+        return _close_truncated(self.repaired_text())
+
+    def _process(self, final: bool):
+        buf = self._pending
+        n = len(buf)
+        out = self._out
+        i = 0
+        while i < n and not self.complete:
+            if not self._started:
+                match = OBJECT_START.search(buf, i)
+                if not match:
+                    i = n
+                    break
+                self._started = True
+                self._depth = 1
+                out.append(match.group())
+                i = match.end()
+                continue
+
+            if self._in_string:
+                if self._escape:
+                    out.append(buf[i])
+                    self._escape = False
+                    i += 1
+                    continue
+                match = STRING_SPECIAL.search(buf, i)
+                end = match.start() if match else n
+                if end > i:
+                    out.append(buf[i:end])
+                    i = end
+                if not match:
+                    break
+                ch = buf[i]
+                if ch == "\\":
+                    out.append(ch)
+                    self._escape = True
+                elif ch == '"':
+                    closes = self._closes_string(buf, i + 1, final)
+                    if closes is None:
+                        break  # Wait for more input to decide
+                    out.append('"' if closes else '\\"')
+                    self._in_string = not closes
+                else:
+                    out.append(CONTROL_ESCAPES.get(ch, f"\\u{ord(ch):04x}"))
+                i += 1
+                continue
+
+            match = STRUCTURE_SPECIAL.search(buf, i)
+            end = match.start() if match else n
+            if end > i:
+                out.append(buf[i:end])
+                i = end
+            if not match:
+                break
+            ch = buf[i]
+            if ch == '"':
+                self._in_string = True
+            elif ch in "{[":
+                self._depth += 1
+            else:
+                self._drop_trailing_comma()
+                self._depth -= 1
+                self.complete = self._depth == 0
+            out.append(ch)
+            i += 1
+        self._pending = "" if self.complete else buf[i:]
+
+    @staticmethod
+    def _closes_string(buf: str, i: int, final: bool) -> Optional[bool]:
+        """
+        Whether a quote inside a string ends it, judged by what follows it.
+        Returns None if the answer depends on input that hasn't arrived yet.
+        """
+        n = len(buf)
+        while i < n and buf[i] in WHITESPACE:
+            i += 1
+        if i >= n:
+            return True if final else None
+        if buf[i] in ":}]":
+            return True
+        if buf[i] != ",":
+            return False
+        i += 1
+        while i < n and buf[i] in WHITESPACE:
+            i += 1
+        if i >= n:
+            return True if final else None
+        return buf[i] in VALUE_START
+
+    def _drop_trailing_comma(self):
+        out = self._out
+        j = len(out) - 1
+        while j >= 0 and not out[j].strip(WHITESPACE):
+            j -= 1
+        if j < 0:
+            return
+        stripped = out[j].rstrip(WHITESPACE)
+        if stripped.endswith(","):
+            out[j] = stripped[:-1]
+            del out[j + 1:]
+
+
+def _close_truncated(text: str) -> Tuple[Any, Optional[str]]:
+    """
+    Close a repaired but unfinished JSON text, see TolerantJSONParser.salvage.
+    Incomplete values are cut at the last comma of the top-level object or of
+    the container directly below it, so lists never end in a partial item.
+    """
+    stack: List[List[Any]] = []  # [opening bracket, position to cut at] per level
+    key: Optional[str] = None  # Top-level key whose value is being written
+    last_string = ""
+    in_string = escape = False
+    string_start = 0
+    for i, ch in enumerate(text):
+        if in_string:
+            if escape:
+                escape = False
+            elif ch == "\\":
+                escape = True
+            elif ch == '"':
+                in_string = False
+                if len(stack) == 1:
+                    last_string = text[string_start:i]
+        elif ch == '"':
+            in_string = True
+            string_start = i + 1
+        elif ch in "{[":
+            stack.append([ch, i + 1])
+        elif ch in "}]":
+            stack.pop()
+        elif ch == ",":
+            stack[-1][1] = i
+            if len(stack) == 1:
+                key = None
+        elif ch == ":" and len(stack) == 1:
+            key = json.loads(f'"{last_string}"')
+
+    def closers(levels: List[List[Any]]) -> str:
+        return "".join("}" if bracket == "{" else "]" for bracket, _ in reversed(levels))
+
+    # The text may end right after a complete value
+    if not in_string and len(stack) <= 2:
+        try:
+            data = json.loads(text.rstrip(WHITESPACE).rstrip(",") + closers(stack))
+            return data, key if len(stack) > 1 else None
+        except json.JSONDecodeError:
+            pass
+    levels = stack[:2]
+    return json.loads(text[: levels[-1][1]] + closers(levels)), key
+
+
+def parse_llm_json(raw: str) -> Any:
+    """
+    Parse the JSON object in an LLM response. Well-formed JSON is decoded
+    directly; anything else goes through the TolerantJSONParser.
+    """
+    start = min((i for i in (raw.find("{"), raw.find("[")) if i >= 0), default=-1)
+    end = max(raw.rfind("}"), raw.rfind("]"))
+    if 0 <= start < end:
+        try:
+            return json.loads(raw[start : end + 1])
+        except json.JSONDecodeError:
+            pass
+    parser = TolerantJSONParser()
+    parser.feed(raw)
+    return parser.result()
+
+
+def salvage_llm_json(raw: str) -> Tuple[Any, Optional[str]]:
+    """
+    Recover the complete fields of a cut-off LLM response, see
+    TolerantJSONParser.salvage.
+    """
+    parser = TolerantJSONParser()
+    parser.feed(raw)
+    return parser.salvage()
+
+
+if __name__ == "__main__":
+    raw = '```json\n{"beat": "The door \\"creaks\\" open.\\nA cold\\u0020wind blows.", "choices": ["1,Enter,3,0"]}\n```'
+    extractor = BeatTextExtractor()
+    for i in range(0, len(raw), 7):
+        new_text = extractor.feed(raw[i : i + 7])
+        if new_text:
+            print(repr(new_text))
+    print("Done:", extractor.done, repr(extractor.text))
+
+    broken = '```json\n{"beat": "She whispers "Run, now!" and\nvanishes.", "choices": ["1,Run,3,0",],}\n```'
+    parser = TolerantJSONParser()
+    for i in range(0, len(broken), 5):
+        parser.feed(broken[i : i + 5])
+    print(parser.result())